@@ -1,23 +1,130 @@
 import heapq
+from array import array
 import math
+import time
 from typing import List
 import numpy as np
 from entities.Robot import Robot
 from entities.Entity import Obstacle, CellState, Grid
+from algo.cache import LRUCache, edge_cache
+from algo.heuristic import (
+    get_goal_heuristic,
+    get_heuristic_table,
+    get_source_heuristic,
+)
+from algo.incremental import IncrementalSearch
 from consts import (
     Direction,
     MOVE_DIRECTION,
     ITERATIONS,
     TURN_RADIUS,
-    SAFE_COST,
 )
-from python_tsp.exact import solve_tsp_dynamic_programming
+from algo.tsp import (
+    is_disconnected,
+    solve_gtsp_anytime,
+    solve_gtsp_dynamic_programming,
+    solve_gtsp_prize_collecting,
+    solve_tsp_subsets,
+)
+from algo.parallel import solve_tsp_subsets_parallel
 
 turn_wrt_big_turns = [
     [2 * TURN_RADIUS, TURN_RADIUS],
     [4 * TURN_RADIUS, 2 * TURN_RADIUS],
 ]
 
+SEARCH_MODES = ("astar", "dijkstra", "incremental", "bidirectional")
+ORDER_MODES = ("gtsp", "combination", "prize")
+
+# Number of view state combinations solved per batched Held-Karp call in the combination order mode
+COMBINATION_BATCH_SIZE = 256
+
+# Directions ordered by their packed index, i.e. DIRECTIONS[d // 2] == d
+DIRECTIONS = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+
+
+class TransitionTable:
+    """Successors of every (x, y, direction) state of a grid, compiled once for a fixed obstacle layout and turn setting.
+
+    States are packed as `(x * size_y + y) * 4 + direction // 2`, so ordering by index is the same as
+    ordering by (x, y, direction). The successors of state `s` are stored CSR-style in
+    `successors[offsets[s]:offsets[s + 1]]`, with the matching edge costs in `costs`.
+    """
+
+    def __init__(self, size_x: int, size_y: int, offsets, successors, costs):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.offsets = offsets
+        self.successors = successors
+        self.costs = costs
+        self._adjacency = None
+        self._predecessors = None
+        self._reachable = dict()
+
+    @property
+    def num_states(self) -> int:
+        return self.size_x * self.size_y * 4
+
+    def encode(self, x: int, y: int, direction: Direction) -> int:
+        return (x * self.size_y + y) * 4 + direction // 2
+
+    def decode(self, index: int):
+        """Returns the (x, y, direction) tuple of a packed state index"""
+        cell, d = divmod(index, 4)
+        x, y = divmod(cell, self.size_y)
+        return x, y, DIRECTIONS[d]
+
+    def get_adjacency(self) -> List[List[tuple]]:
+        """Returns, for every state, the list of (successor, cost) pairs. Built on first use"""
+        if self._adjacency is None:
+            offsets = self.offsets.tolist()
+            edges = list(zip(self.successors.tolist(), self.costs.tolist()))
+            self._adjacency = [
+                edges[offsets[s] : offsets[s + 1]] for s in range(self.num_states)
+            ]
+        return self._adjacency
+
+    def get_reachable(self, source: int) -> bytearray:
+        """Returns a flag per state, set for the states some path from source reaches. Cached by source"""
+        if source not in self._reachable:
+            adjacency = self.get_adjacency()
+            reachable = bytearray(self.num_states)
+            reachable[source] = 1
+            stack = [source]
+            while stack:
+                for succ, _ in adjacency[stack.pop()]:
+                    if not reachable[succ]:
+                        reachable[succ] = 1
+                        stack.append(succ)
+            self._reachable[source] = reachable
+        return self._reachable[source]
+
+    def set_reachable(self, source: int, reachable: bytearray):
+        """Cache the flags of `get_reachable` for a source, such as the states closed by a search that ran out of states"""
+        self._reachable[source] = reachable
+
+    def is_unreachable(self, source: int, target: int) -> bool:
+        """Whether target is known to be unreachable from source, from the flags cached for source. False if unknown"""
+        reachable = self._reachable.get(source)
+        return reachable is not None and not reachable[target]
+
+    def get_predecessors(self) -> List[List[tuple]]:
+        """Returns, for every state, the list of (predecessor, cost) pairs. Built on first use"""
+        if self._predecessors is None:
+            # Sort the edges by successor, keeping them in order of their source within a successor
+            order = np.argsort(self.successors, kind="stable")
+            sources = np.repeat(np.arange(self.num_states), np.diff(self.offsets))
+            offsets = np.zeros(self.num_states + 1, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.successors, minlength=self.num_states), out=offsets[1:]
+            )
+            offsets = offsets.tolist()
+            edges = list(zip(sources[order].tolist(), self.costs[order].tolist()))
+            self._predecessors = [
+                edges[offsets[t] : offsets[t + 1]] for t in range(self.num_states)
+            ]
+        return self._predecessors
+
 
 class MazeSolver:
     def __init__(
@@ -28,6 +135,10 @@ class MazeSolver:
         robot_y: int,
         robot_direction: Direction,
         big_turn=None,  # the big_turn here is to allow 3-1 turn(0 - by default) | 4-2 turn(1)
+        search_mode="astar",  # "astar": one A* search per pair of states | "dijkstra": one search per source state | "incremental": "dijkstra" kept up to date across update_obstacles | "bidirectional": A* from both ends of each pair
+        cache_edges=True,  # reuse edges across solvers through the process-wide edge cache
+        order_mode="gtsp",  # "gtsp": joint view state and order DP | "combination": one TSP per combination of view states | "prize": one DP visiting as many obstacles as possible
+        workers=1,  # number of worker processes evaluating combinations in the combination order mode
     ):
         # Initialize a Grid object for the arena representation
         self.grid = Grid(size_x, size_y)
@@ -36,10 +147,28 @@ class MazeSolver:
         # Create tables for paths and costs
         self.path_table = dict()
         self.cost_table = dict()
+        # Compiled successor table, built lazily once per obstacle layout
+        self.transition_table = None
+        # Incremental searches of the "incremental" search mode, by packed index of their source state
+        self.incremental_searches = dict()
         if big_turn is None:
             self.big_turn = 0
         else:
             self.big_turn = int(big_turn)
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Invalid search mode: {search_mode}")
+        self.search_mode = search_mode
+        self.cache_edges = cache_edges
+        if order_mode not in ORDER_MODES:
+            raise ValueError(f"Invalid order mode: {order_mode}")
+        self.order_mode = order_mode
+        self.workers = workers
+        self.pruned_combinations = 0
+        # Seconds spent in each stage of the last get_optimal_order_anytime call
+        self.timings = dict()
+        # (start, end) of the edges left unsearched at the deadline of the last get_optimal_order_anytime call that
+        # turned out to have no path
+        self.unreachable_edges = set()
 
     def add_obstacle(self, x: int, y: int, direction: Direction, obstacle_id: int):
         """Add obstacle to MazeSolver object
@@ -54,9 +183,146 @@ class MazeSolver:
         obstacle = Obstacle(x, y, direction, obstacle_id)
         # Add created obstacle to grid object
         self.grid.add_obstacle(obstacle)
+        self.transition_table = None
+        self.incremental_searches = dict()
 
     def reset_obstacles(self):
         self.grid.reset_obstacles()
+        self.transition_table = None
+        self.incremental_searches = dict()
+
+    def update_obstacles(self, added=(), removed=()):
+        """Add and remove obstacles between two solves. Searches of the "incremental" search mode are kept and only
+        repaired around the cells that changed, the next get_optimal_order_dp call replans from them. Edges whose path
+        avoids the changed cells, and which no path through a freed cell can beat, are kept as well.
+
+        Args:
+            added (Iterable[tuple]): (x, y, direction, obstacle_id) of each obstacle to add
+            removed (Iterable[int]): ids of the obstacles to remove. A moved obstacle is removed and added again
+        """
+        old_maps = self.get_layout_maps()
+
+        for obstacle_id in removed:
+            self.grid.remove_obstacle(obstacle_id)
+        for x, y, direction, obstacle_id in added:
+            self.grid.add_obstacle(Obstacle(x, y, direction, obstacle_id))
+
+        self.transition_table = None
+        table = self.get_transition_table()
+        reachable, reachable_turn, safe_cost = self.get_layout_maps()
+        old_reachable, old_reachable_turn, old_safe_cost = old_maps
+
+        # Moves into a cell depend on its reachability and safe cost, and turns out of a cell on its turn reachability
+        turn_changed = reachable_turn != old_reachable_turn
+        changed = (reachable != old_reachable) | turn_changed | (safe_cost != old_safe_cost)
+        # Cells where some move became possible or cheaper, through which a path may now be shorter
+        improved = (
+            (reachable & ~old_reachable)
+            | (reachable_turn & ~old_reachable_turn)
+            | (safe_cost < old_safe_cost)
+        )
+        # Cells where some move became impossible or dearer
+        worsened = (
+            (old_reachable & ~reachable)
+            | (old_reachable_turn & ~reachable_turn)
+            | (safe_cost > old_safe_cost)
+        )
+
+        self.keep_valid_edges(
+            {(int(x), int(y)) for x, y in np.argwhere(changed)}, np.argwhere(improved)
+        )
+
+        # Searches from states that are no longer a view state or the start would only be repaired, never asked again
+        sources = {self.robot.get_start_state()}
+        for retrying in (False, True):
+            for view_states in self.grid.get_view_obstacle_positions(retrying):
+                sources.update(view_states)
+        source_indices = {table.encode(state.x, state.y, state.direction) for state in sources}
+        worsened_states = [
+            table.encode(x, y, direction)
+            for x, y in np.argwhere(worsened).tolist()
+            for direction in DIRECTIONS
+        ]
+        self.incremental_searches = {
+            index: search
+            for index, search in self.incremental_searches.items()
+            if index in source_indices
+        }
+        if not self.incremental_searches:
+            return
+
+        # States whose incoming edges changed: those of the changed cells, and those reached by a turn out of a cell
+        # whose turn reachability changed
+        affected = set()
+        for x, y in np.argwhere(changed).tolist():
+            affected.update(table.encode(x, y, direction) for direction in DIRECTIONS)
+        turns = [
+            (dx, dy, new_direction)
+            for direction in DIRECTIONS
+            for dx, dy, new_direction, is_turn in self.get_move_candidates(direction)
+            if is_turn
+        ]
+        for x, y in np.argwhere(turn_changed).tolist():
+            for dx, dy, new_direction in turns:
+                if self.grid.is_valid_coord(x + dx, y + dy):
+                    affected.add(table.encode(x + dx, y + dy, new_direction))
+
+        affected = sorted(affected)
+        for search in self.incremental_searches.values():
+            search.update_table(table, affected, worsened_states)
+
+    def get_layout_maps(self):
+        """Returns the reachability, turn reachability and safe cost maps of the grid, which make up the transition
+        table of the current obstacles
+        """
+        return (
+            self.grid.get_reachable_map(),
+            self.grid.get_reachable_map(turn=True),
+            self.grid.get_safe_cost_map(),
+        )
+
+    def keep_valid_edges(self, changed_cells: set, improved_cells: np.ndarray):
+        """Drop the edges of the path and cost tables that a change of the obstacles may have made invalid or beaten
+
+        An edge is kept if its path avoids the changed cells, so that every move of it is unchanged, and if the
+        obstacle-free cost of going through any improved cell is at least its cost, so that no new path is shorter.
+        Both directions of an edge are kept or dropped together.
+
+        Args:
+            changed_cells (set): (x, y) of the cells whose reachability or safe cost changed
+            improved_cells (np.ndarray): [x, y] rows of the cells where some move became possible or cheaper
+        """
+        dropped = {
+            (start, end)
+            for (start, end), path in self.path_table.items()
+            if any((x, y) in changed_cells for x, y, _ in path)
+        }
+        edges = [edge for edge in self.path_table if edge not in dropped]
+
+        if edges and len(improved_cells):
+            size_x, size_y = self.grid.size_x, self.grid.size_y
+            heuristic = self.get_heuristic_table()
+            # [edge, 1]: start and end of each edge, [1, state]: each direction of each improved cell
+            start_x, start_y, start_d, end_x, end_y, end_d = np.array(
+                [
+                    (start.x, start.y, start.direction // 2, end.x, end.y, end.direction // 2)
+                    for start, end in edges
+                ]
+            ).T[:, :, None]
+            cell_x = np.repeat(improved_cells[:, 0], 4)[None, :]
+            cell_y = np.repeat(improved_cells[:, 1], 4)[None, :]
+            cell_d = np.tile(np.arange(4), len(improved_cells))[None, :]
+            through = (
+                heuristic[start_d, cell_x - start_x + size_x - 1, cell_y - start_y + size_y - 1, cell_d]
+                + heuristic[cell_d, end_x - cell_x + size_x - 1, end_y - cell_y + size_y - 1, end_d]
+            ).min(axis=1)
+            costs = np.array([self.cost_table[edge] for edge in edges])
+            dropped.update(edge for edge, beaten in zip(edges, through < costs) if beaten)
+
+        for start, end in dropped:
+            for key in ((start, end), (end, start)):
+                self.path_table.pop(key, None)
+                self.cost_table.pop(key, None)
 
     @staticmethod
     def compute_coord_distance(x1: int, y1: int, x2: int, y2: int):
@@ -98,16 +364,59 @@ class MazeSolver:
         return s
 
     def get_optimal_order_dp(self, retrying):
+        optimal_path, distance, _ = self.get_optimal_order_anytime(retrying)
+        return optimal_path, distance
+
+    def get_optimal_order_anytime(self, retrying, deadline=None):
+        """Find the shortest path visiting the view states of as many obstacles as possible
+
+        Args:
+            retrying (bool): passed on to the view state generation
+            deadline (float, optional): time.monotonic() value by which to answer. Without a deadline the search is exact,
+                otherwise a heuristic order is found first and improved until the deadline
+
+        Returns:
+            Tuple[List[CellState], float, bool]: the path, its distance, and whether it is proven optimal
+        """
         distance = 1e9
         optimal_path = []
+        # Stays True only while every subset that was given up on is proven infeasible
+        proven_optimal = True
+        # Number of view state combinations discarded by their lower bound in the combination order mode
+        self.pruned_combinations = 0
+        self.timings = dict()
+        self.unreachable_edges = set()
 
         # Get all possible positions that can view the obstacles
+        start = time.perf_counter()
         all_view_positions = self.grid.get_view_obstacle_positions(retrying)
+        self.add_timing("view_states", start)
         # print(f"all_view_positions: {all_view_positions}")
 
+        if self.order_mode == "prize":
+            # A single DP over every obstacle answers every subset of obstacles, so no subset loop is needed
+            return self.solve_order_prize(all_view_positions)
+
+        # No path visits an obstacle whose view states the robot cannot reach, so the subsets with one are skipped
+        table = self.get_transition_table()
+        start_state = self.robot.get_start_state()
+        reachable = table.get_reachable(
+            table.encode(start_state.x, start_state.y, start_state.direction)
+        )
+        unreachable_obstacles = [
+            idx
+            for idx, view_positions in enumerate(all_view_positions)
+            if not any(
+                reachable[table.encode(view.x, view.y, view.direction)]
+                for view in view_positions
+            )
+        ]
+
         for op in self.get_visit_options(len(all_view_positions)):
             # op is binary string of length len(all_view_positions) == len(obstacles)
             # If index == 1 means the view_positions[index] is selected to visit, otherwise drop
+            if any(op[idx] == "1" for idx in unreachable_obstacles):
+                continue
 
             # Calculate optimal_cost table
 
@@ -129,427 +438,815 @@ class MazeSolver:
                     cur_view_positions.append(all_view_positions[idx])
                     # print("obstacle: {}\n".format(self.grid.obstacles[idx]))
 
-            # Generate the path cost for the items
-            self.path_cost_generator(items)
-            combination = []
-            self.generate_combination(
-                cur_view_positions, 0, [], combination, [ITERATIONS]
+            # Generate the path cost for the items. Under a deadline, the edges are searched cheapest estimate first,
+            # those left unsearched are ordered by their estimate, and only those the order uses are searched afterwards
+            start = time.perf_counter()
+            estimates = dict()
+            pairs = None
+            if deadline is not None:
+                estimates = self.estimate_costs(
+                    items,
+                    [(i, j) for i in range(len(items) - 1) for j in range(i + 1, len(items))],
+                )
+                pairs = sorted(estimates, key=estimates.get)
+            skipped = self.path_cost_generator(items, deadline, pairs)
+            estimates = {pair: estimates[pair] for pair in skipped}
+            self.add_timing("edges", start)
+
+            start = time.perf_counter()
+            order, _distance, proven = self.solve_order(
+                items, cur_view_positions, deadline, estimates
             )
-
-            for c in combination:  # run the algo some times ->
-                visited_candidates = [0]  # add the start state of the robot
-
-                cur_index = 1
-                fixed_cost = (
-                    0  # the cost applying for the position taking obstacle pictures
+            while not self.search_estimated_edges(items, order, estimates):
+                # An edge of the order has no path, so the order is solved again without it
+                order, _distance, proven = self.solve_order(
+                    items, cur_view_positions, deadline, estimates
                 )
-                for index, view_position in enumerate(cur_view_positions):
-                    visited_candidates.append(cur_index + c[index])
-                    fixed_cost += view_position[c[index]].penalty
-                    cur_index += len(view_position)
-
-                cost_np = np.zeros((len(visited_candidates), len(visited_candidates)))
-
-                for s in range(len(visited_candidates) - 1):
-                    for e in range(s + 1, len(visited_candidates)):
-                        u = items[visited_candidates[s]]
-                        v = items[visited_candidates[e]]
-                        if (u, v) in self.cost_table.keys():
-                            cost_np[s][e] = self.cost_table[(u, v)]
-                        else:
-                            cost_np[s][e] = 1e9
-                        cost_np[e][s] = cost_np[s][e]
-                cost_np[:, 0] = 0
-                _permutation, _distance = solve_tsp_dynamic_programming(cost_np)
-                # print(f"fixed_cost = {fixed_cost}")
-                # print(f"distance = {_distance}")
-                if _distance + fixed_cost >= distance:
-                    continue
+            if skipped and order:
+                _distance = self.get_order_cost(items, order)
+            proven_optimal = proven_optimal and proven and not skipped
 
-                optimal_path = [items[0]]
-                distance = _distance + fixed_cost
+            if order:
+                # if found optimal path, return
+                optimal_path = self.build_path(items, order)
+                distance = _distance
+                self.add_timing("order", start)
+                break
+            self.add_timing("order", start)
 
-                for i in range(len(_permutation) - 1):
-                    from_item = items[visited_candidates[_permutation[i]]]
-                    to_item = items[visited_candidates[_permutation[i + 1]]]
+        return optimal_path, distance, proven_optimal
 
-                    cur_path = self.path_table[(from_item, to_item)]
-                    for j in range(1, len(cur_path)):
-                        optimal_path.append(
-                            CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2])
-                        )
+    def solve_order(self, items: List[CellState], view_positions, deadline=None, estimates=None):
+        """Solve the visiting order with the solver of the order mode, see `solve_order_gtsp` and
+        `solve_order_combination`
+        """
+        if self.order_mode == "gtsp":
+            return self.solve_order_gtsp(items, view_positions, deadline, estimates)
+        return self.solve_order_combination(items, view_positions, deadline, estimates)
 
-                    optimal_path[-1].screenshot_id = to_item.screenshot_id
+    def estimate_costs(self, items: List[CellState], pairs: List[tuple]) -> dict:
+        """Lower bound on the cost of edges that are not searched yet: their obstacle-free cost from the heuristic table,
+        plus the safe cost of their end, which the last move pays. Edges known to have no path are not estimated: those
+        from a state the robot can reach to one it cannot, and those to a state that a search from their start did not
+        reach.
 
-            if optimal_path:
-                # if found optimal path, return
-                break
+        Args:
+            items (List[CellState]): the robot's start state followed by the candidate view states
+            pairs (List[tuple]): (i, j) indices into items of the edges to estimate
 
-        return optimal_path, distance
+        Returns:
+            dict: estimated cost by (i, j), for the edges neither in the cost table nor known to have no path
+        """
+        if not pairs:
+            return dict()
+
+        heuristic = self.get_heuristic_table()
+        safe_cost = self.grid.get_safe_cost_map()
+        table = self.get_transition_table()
+        size_x, size_y = self.grid.size_x, self.grid.size_y
+        indices = [table.encode(item.x, item.y, item.direction) for item in items]
+        reachable = table.get_reachable(indices[0])
+        estimates = dict()
+        for i, j in pairs:
+            start, end = items[i], items[j]
+            if (start, end) in self.cost_table or (start, end) in self.unreachable_edges:
+                continue
+            if table.is_unreachable(indices[i], indices[j]) or (
+                reachable[indices[i]] and not reachable[indices[j]]
+            ):
+                continue
+            estimates[(i, j)] = float(
+                heuristic[
+                    start.direction // 2,
+                    end.x - start.x + size_x - 1,
+                    end.y - start.y + size_y - 1,
+                    end.direction // 2,
+                ]
+                + safe_cost[end.x, end.y]
+            )
+        return estimates
 
-    @staticmethod
-    def generate_combination(view_positions, index, current, result, iteration_left):
-        if index == len(view_positions):
-            result.append(current[:])
-            return
+    def search_estimated_edges(self, items: List[CellState], order: List[int], estimates: dict) -> bool:
+        """Search the edges of a visiting order whose cost was only estimated, and drop them from the estimates
 
-        if iteration_left[0] == 0:
-            return
+        Returns:
+            bool: whether every edge of the order has a path
+        """
+        pending = [
+            pair
+            for pair in (tuple(sorted(edge)) for edge in zip(order, order[1:]))
+            if pair in estimates
+        ]
+        start = time.perf_counter()
+        self.path_cost_generator(items, pairs=pending)
+        found = True
+        for i, j in pending:
+            del estimates[(i, j)]
+            if (items[i], items[j]) not in self.cost_table:
+                self.unreachable_edges.add((items[i], items[j]))
+                found = False
+        self.add_timing("edges", start)
+        return found
+
+    def get_order_cost(self, items: List[CellState], order: List[int]) -> float:
+        """Total cost of a visiting order from the cost table, including the penalties of its view states"""
+        return sum(
+            self.cost_table[(items[i], items[j])] for i, j in zip(order, order[1:])
+        ) + sum(items[i].penalty for i in order[1:])
+
+    def add_timing(self, stage: str, start: float):
+        """Add the time since start (a time.perf_counter() value) to a stage of `timings`"""
+        self.timings[stage] = self.timings.get(stage, 0) + time.perf_counter() - start
+
+    def get_cost_matrix(
+        self, items: List[CellState], missing_cost=np.inf, estimates=None
+    ) -> np.ndarray:
+        """Build the item x item matrix of edge costs from the cost table
 
-        iteration_left[0] -= 1
-        for j in range(len(view_positions[index])):
-            current.append(j)
-            MazeSolver.generate_combination(
-                view_positions, index + 1, current, result, iteration_left
-            )
-            current.pop()
+        Args:
+            items (List[CellState]): the robot's start state followed by the candidate view states
+            missing_cost (float, optional): cost of edges without a path. Defaults to np.inf.
+            estimates (dict, optional): cost by (i, j) of edges that were not searched, see `estimate_costs`
 
-    def get_safe_cost(self, x, y):
-        """Get the safe cost of a particular x,y coordinate wrt obstacles that are exactly 2 units away from it in both x and y directions
+        Returns:
+            np.ndarray: cost matrix, where the cost of returning to the start state (column 0) is 0
+        """
+        cost_np = np.full((len(items), len(items)), float(missing_cost))
+        np.fill_diagonal(cost_np, 0)
+
+        for s in range(len(items) - 1):
+            for e in range(s + 1, len(items)):
+                cost = self.cost_table.get((items[s], items[e]))
+                if cost is None and estimates:
+                    cost = estimates.get((s, e))
+                if cost is not None:
+                    cost_np[s][e] = cost
+                    cost_np[e][s] = cost
+        cost_np[:, 0] = 0
+        return cost_np
+
+    def solve_order_gtsp(
+        self, items: List[CellState], view_positions, deadline=None, estimates=None
+    ):
+        """Choose one view state per obstacle and the order to visit them in a single generalized TSP dynamic program
 
         Args:
-            x (int): x-coordinate
-            y (int): y-coordinate
+            items (List[CellState]): the robot's start state followed by the view states of every obstacle in view_positions
+            view_positions (List[List[CellState]]): view states of each obstacle to visit
+            deadline (float, optional): time.monotonic() value, if given the anytime solver is used
+            estimates (dict, optional): cost of the edges that were not searched, see `get_cost_matrix`
 
         Returns:
-            int: safe cost
+            Tuple[List[int], float, bool]: indices into items in visiting order, the total cost including view penalties, and whether it is proven optimal. ([], 1e9, ...) if no feasible order was found
         """
-        for ob in self.grid.obstacles:
-            if abs(ob.x - x) == 2 and abs(ob.y - y) == 2:
-                return SAFE_COST
+        groups = []
+        cur_index = 1
+        for view_position in view_positions:
+            groups.append(list(range(cur_index, cur_index + len(view_position))))
+            cur_index += len(view_position)
+
+        penalties = np.array([0] + [item.penalty for item in items[1:]], dtype=float)
+        cost_np = self.get_cost_matrix(items, estimates=estimates)
+
+        if is_disconnected(cost_np, groups):
+            return [], 1e9, True
+        if deadline is None:
+            order, distance = solve_gtsp_dynamic_programming(cost_np, groups, penalties)
+            proven = True
+        else:
+            order, distance, proven = solve_gtsp_anytime(
+                cost_np, groups, penalties, deadline
+            )
 
-            if abs(ob.x - x) == 1 and abs(ob.y - y) == 2:
-                return SAFE_COST
+        if not order:
+            return [], 1e9, proven
+        return order, distance, proven
 
-            if abs(ob.x - x) == 2 and abs(ob.y - y) == 1:
-                return SAFE_COST
+    def solve_order_prize(self, all_view_positions):
+        """Visit as many obstacles as possible, breaking ties by distance, with one prize-collecting GTSP over the view
+        states of every obstacle. Gives the same number of obstacles as trying the subsets from the largest down, and
+        the cheapest path among them, from a single cost table.
 
-        return 0
+        Args:
+            all_view_positions (List[List[CellState]]): view states of every obstacle
 
-    def get_neighbors(
-        self, x, y, direction
-    ):  # TODO: see the behavior of the robot and adjust...
+        Returns:
+            Tuple[List[CellState], float, bool]: the path, its distance, and whether it is proven optimal (always True)
         """
-        Return a list of tuples with format:
-        newX, newY, new_direction
+        items = [self.robot.get_start_state()]
+        groups = []
+        for view_position in all_view_positions:
+            groups.append(list(range(len(items), len(items) + len(view_position))))
+            items = items + view_position
+
+        start = time.perf_counter()
+        self.path_cost_generator(items)
+        self.add_timing("edges", start)
+
+        start = time.perf_counter()
+        penalties = np.array([0] + [item.penalty for item in items[1:]], dtype=float)
+        order, distance, _ = solve_gtsp_prize_collecting(
+            self.get_cost_matrix(items), groups, penalties
+        )
+        optimal_path = self.build_path(items, order)
+        self.add_timing("order", start)
+        return optimal_path, distance, True
+
+    def solve_order_combination(
+        self, items: List[CellState], view_positions, deadline=None, estimates=None
+    ):
+        """Enumerate combinations of view states (capped by ITERATIONS) and solve their TSPs in batched Held-Karp calls
+
+        Args:
+            items (List[CellState]): the robot's start state followed by the view states of every obstacle in view_positions
+            view_positions (List[List[CellState]]): view states of each obstacle to visit
+            deadline (float, optional): time.monotonic() value after which no more combinations are tried, once a
+                feasible one is found
+            estimates (dict, optional): cost of the edges that were not searched, see `get_cost_matrix`
+
+        Returns:
+            Tuple[List[int], float, bool]: indices into items in visiting order, the total cost including view penalties, and whether every combination was tried. ([], 1e9, ...) if no feasible order was found
         """
-        # Neighbors have the following format: {newX, newY, movement direction, safe cost}
-        # Neighbors are coordinates that fulfill the following criteria:
-        # If moving in the same direction:
-        #   - Valid position within bounds
-        #   - Must be at least 4 units away in total (x+y)
-        #   - Furthest distance must be at least 3 units away (x or y)
-        # If it is exactly 2 units away in both x and y directions, safe cost = SAFECOST. Else, safe cost = 0
-
-        neighbors = []
-        # Assume that after following this direction, the car direction is EXACTLY md
-        for dx, dy, md in MOVE_DIRECTION:
-            if md == direction:  # if the new direction == md
-                # Check for valid position
-                if self.grid.reachable(x + dx, y + dy):  # go forward;
-                    # Get safe cost of destination
-                    safe_cost = self.get_safe_cost(x + dx, y + dy)
-                    neighbors.append((x + dx, y + dy, md, safe_cost))
-                # Check for valid position
-                if self.grid.reachable(x - dx, y - dy):  # go back;
-                    # Get safe cost of destination
-                    safe_cost = self.get_safe_cost(x - dx, y - dy)
-                    neighbors.append((x - dx, y - dy, md, safe_cost))
-
-            else:  # consider 8 cases
-
-                # Turning displacement is either 4-2 or 3-1
-                bigger_change = turn_wrt_big_turns[self.big_turn][0]
-                smaller_change = turn_wrt_big_turns[self.big_turn][1]
-
-                # north <-> east
-                if direction == Direction.NORTH and md == Direction.EAST:
-
-                    # Check for valid position
-                    if self.grid.reachable(
-                        x + bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        # Get safe cost of destination
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+        distance = 1e9
+        optimal_order = []
 
-                    # Check for valid position
-                    if self.grid.reachable(
-                        x - smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        # Get safe cost of destination
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
+        combination = []
+        self.generate_combination(view_positions, 0, [], combination, [ITERATIONS])
+        # The ITERATIONS cap may have cut the enumeration short
+        proven = len(combination) == math.prod(len(vp) for vp in view_positions)
 
-                if direction == Direction.EAST and md == Direction.NORTH:
-                    if self.grid.reachable(
-                        x + smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        if not combination:
+            return optimal_order, distance, proven
 
-                    if self.grid.reachable(
-                        x - bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+        # Every combination's cost matrix is fancy-indexed out of one item x item matrix
+        cost_all = self.get_cost_matrix(items, missing_cost=1e9, estimates=estimates)
+        penalties = np.array([0] + [item.penalty for item in items[1:]], dtype=float)
 
-                # east <-> south
-                if direction == Direction.EAST and md == Direction.SOUTH:
+        lengths = [len(view_position) for view_position in view_positions]
+        offsets = np.array(
+            [1 + sum(lengths[:index]) for index in range(len(lengths))], dtype=np.int64
+        )
+        if is_disconnected(
+            cost_all,
+            [list(range(offset, offset + length)) for offset, length in zip(offsets, lengths)],
+        ):
+            return optimal_order, distance, proven
+        # visited_candidates[c]: the start state followed by the chosen view state of each obstacle
+        visited_candidates = np.zeros(
+            (len(combination), len(view_positions) + 1), dtype=np.int64
+        )
+        visited_candidates[:, 1:] = offsets + np.array(
+            combination, dtype=np.int64
+        ).reshape(len(combination), len(view_positions))
+        # the cost applying for the position taking obstacle pictures
+        fixed_cost = penalties[visited_candidates].sum(axis=1)
+
+        if self.workers > 1:
+            best, _distance, order, completed, pruned = solve_tsp_subsets_parallel(
+                cost_all,
+                visited_candidates,
+                fixed_cost,
+                self.workers,
+                COMBINATION_BATCH_SIZE,
+                deadline,
+            )
+        else:
+            best, _distance, order, completed, pruned = solve_tsp_subsets(
+                cost_all,
+                visited_candidates,
+                fixed_cost,
+                COMBINATION_BATCH_SIZE,
+                deadline,
+            )
+        proven = proven and completed
+        self.pruned_combinations += pruned
 
-                    if self.grid.reachable(
-                        x + smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
+        if best != -1:
+            distance = _distance
+            optimal_order = order
 
-                    if self.grid.reachable(
-                        x - bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+        return optimal_order, distance, proven
 
-                if direction == Direction.SOUTH and md == Direction.EAST:
-                    if self.grid.reachable(
-                        x + bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+    def build_path(self, items: List[CellState], order: List[int]) -> List[CellState]:
+        """Concatenate the paths between consecutive items of a visiting order
 
-                    if self.grid.reachable(
-                        x - smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        Args:
+            items (List[CellState]): the robot's start state followed by the candidate view states
+            order (List[int]): indices into items in visiting order, starting with 0
 
-                # south <-> west
-                if direction == Direction.SOUTH and md == Direction.WEST:
-                    if self.grid.reachable(
-                        x - bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+        Returns:
+            List[CellState]: cell states of the full path, with screenshot_id set at each view state
+        """
+        # Copy the start state, as its screenshot_id is updated below when the first view state is the start position
+        optimal_path = [CellState(items[0].x, items[0].y, items[0].direction)]
 
-                    if self.grid.reachable(
-                        x + smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        for i in range(len(order) - 1):
+            from_item = items[order[i]]
+            to_item = items[order[i + 1]]
 
-                if direction == Direction.WEST and md == Direction.SOUTH:
-                    if self.grid.reachable(
-                        x - smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
+            cur_path = self.path_table[(from_item, to_item)]
+            for j in range(1, len(cur_path)):
+                optimal_path.append(
+                    CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2])
+                )
 
-                    if self.grid.reachable(
-                        x + bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+            optimal_path[-1].screenshot_id = to_item.screenshot_id
 
-                # west <-> north
-                if direction == Direction.WEST and md == Direction.NORTH:
-                    if self.grid.reachable(
-                        x - smaller_change, y + bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - smaller_change, y + bigger_change
-                        )
-                        neighbors.append(
-                            (x - smaller_change, y + bigger_change, md, safe_cost + 10)
-                        )
+        return optimal_path
 
-                    if self.grid.reachable(
-                        x + bigger_change, y - smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + bigger_change, y - smaller_change
-                        )
-                        neighbors.append(
-                            (x + bigger_change, y - smaller_change, md, safe_cost + 10)
-                        )
+    @staticmethod
+    def generate_combination(view_positions, index, current, result, iteration_left):
+        if index == len(view_positions):
+            result.append(current[:])
+            return
 
-                if direction == Direction.NORTH and md == Direction.WEST:
-                    if self.grid.reachable(
-                        x + smaller_change, y - bigger_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x + smaller_change, y - bigger_change
-                        )
-                        neighbors.append(
-                            (x + smaller_change, y - bigger_change, md, safe_cost + 10)
-                        )
+        if iteration_left[0] == 0:
+            return
 
-                    if self.grid.reachable(
-                        x - bigger_change, y + smaller_change, turn=True
-                    ) and self.grid.reachable(x, y, preTurn=True):
-                        safe_cost = self.get_safe_cost(
-                            x - bigger_change, y + smaller_change
-                        )
-                        neighbors.append(
-                            (x - bigger_change, y + smaller_change, md, safe_cost + 10)
-                        )
+        iteration_left[0] -= 1
+        for j in range(len(view_positions[index])):
+            current.append(j)
+            MazeSolver.generate_combination(
+                view_positions, index + 1, current, result, iteration_left
+            )
+            current.pop()
+
+    def get_move_candidates(self, direction: Direction) -> List[tuple]:
+        """List the moves the robot can try from a state facing `direction`: a step forward or backward, and the turns
+        to each side. Whether a move is valid depends on the obstacles, see `get_transition_table`
+
+        Returns:
+            List[tuple]: (dx, dy, new_direction, is_turn) of each move
+        """
+        bigger_change = turn_wrt_big_turns[self.big_turn][0]
+        smaller_change = turn_wrt_big_turns[self.big_turn][1]
+        b, s = bigger_change, smaller_change
+
+        turns = {
+            # north <-> east
+            (Direction.NORTH, Direction.EAST): [(b, s), (-s, -b)],
+            (Direction.EAST, Direction.NORTH): [(s, b), (-b, -s)],
+            # east <-> south
+            (Direction.EAST, Direction.SOUTH): [(s, -b), (-b, s)],
+            (Direction.SOUTH, Direction.EAST): [(b, -s), (-s, b)],
+            # south <-> west
+            (Direction.SOUTH, Direction.WEST): [(-b, -s), (s, b)],
+            (Direction.WEST, Direction.SOUTH): [(-s, -b), (b, s)],
+            # west <-> north
+            (Direction.WEST, Direction.NORTH): [(-s, b), (b, -s)],
+            (Direction.NORTH, Direction.WEST): [(s, -b), (-b, s)],
+        }
+
+        candidates = []
+        for dx, dy, md in MOVE_DIRECTION:
+            if md == direction:
+                candidates += [(dx, dy, md, False), (-dx, -dy, md, False)]
+            else:
+                candidates += [
+                    (tx, ty, md, True) for tx, ty in turns.get((direction, md), [])
+                ]
+        return candidates
+
+    def get_heuristic_table(self) -> np.ndarray:
+        """Obstacle-free cost of every relative move for this solver's turn setting, see `build_heuristic_table`"""
+        candidates = [
+            [
+                (
+                    dx,
+                    dy,
+                    new_direction,
+                    is_turn,
+                    Direction.rotation_cost(new_direction, direction)
+                    + 1
+                    + (10 if is_turn else 0),
+                )
+                for dx, dy, new_direction, is_turn in self.get_move_candidates(direction)
+            ]
+            for direction in DIRECTIONS
+        ]
+        return get_heuristic_table(
+            self.big_turn, candidates, self.grid.size_x, self.grid.size_y
+        )
 
-        return neighbors
+    def get_transition_table(self) -> TransitionTable:
+        """Compile the moves of every state into a TransitionTable, reusing it until the obstacles change. The moves of
+        `get_move_candidates` are checked against the grid's reachability and safe cost maps for all states at once: a
+        move forward or backward needs a reachable target, and a turn a turn-reachable target from a pre-turn cell.
+        Each move costs its rotation, one step and the safe cost of its target, plus 10 for a turn.
 
-    def path_cost_generator(self, states: List[CellState]):
+        Returns:
+            TransitionTable: successor indices and move costs of every state
+        """
+        if self.transition_table is not None:
+            return self.transition_table
+
+        size_x, size_y = self.grid.size_x, self.grid.size_y
+        # Pad the maps so that moves leaving the arena can be looked up, and are unreachable
+        pad = max(turn_wrt_big_turns[self.big_turn])
+        reachable = np.pad(self.grid.get_reachable_map(), pad)
+        reachable_turn = np.pad(self.grid.get_reachable_map(turn=True), pad)
+        pre_turn = self.grid.get_reachable_map(preTurn=True)
+        safe_cost = np.pad(self.grid.get_safe_cost_map(), pad)
+
+        xs, ys = np.meshgrid(np.arange(size_x), np.arange(size_y), indexing="ij")
+        candidates = [self.get_move_candidates(direction) for direction in DIRECTIONS]
+        width = max(len(moves) for moves in candidates)
+
+        # [x, y, direction, k]: the k-th move from state (x, y, direction), in `get_move_candidates` order
+        valid = np.zeros((size_x, size_y, 4, width), dtype=bool)
+        successors = np.zeros((size_x, size_y, 4, width), dtype=np.int32)
+        costs = np.zeros((size_x, size_y, 4, width), dtype=np.int64)
+
+        for d, moves in enumerate(candidates):
+            for k, (dx, dy, new_direction, is_turn) in enumerate(moves):
+                next_x, next_y = xs + dx, ys + dy
+                if is_turn:
+                    valid[:, :, d, k] = (
+                        reachable_turn[next_x + pad, next_y + pad] & pre_turn
+                    )
+                else:
+                    valid[:, :, d, k] = reachable[next_x + pad, next_y + pad]
+                successors[:, :, d, k] = (next_x * size_y + next_y) * 4 + new_direction // 2
+                costs[:, :, d, k] = (
+                    Direction.rotation_cost(new_direction, DIRECTIONS[d])
+                    + 1
+                    + safe_cost[next_x + pad, next_y + pad]
+                    + (10 if is_turn else 0)
+                )
+
+        # States are laid out in packed index order, so the valid moves flatten straight into CSR arrays
+        offsets = np.zeros(size_x * size_y * 4 + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=3).reshape(-1), out=offsets[1:])
+
+        self.transition_table = TransitionTable(
+            size_x, size_y, offsets, successors[valid], costs[valid]
+        )
+        return self.transition_table
+
+    def path_cost_generator(
+        self, states: List[CellState], deadline=None, pairs=None
+    ) -> List[tuple]:
         """Generate the path cost between the input states and update the tables accordingly
 
         Args:
             states (List[CellState]): cell states to visit
+            deadline (float, optional): time.monotonic() value after which no more searches are started
+            pairs (List[tuple], optional): (i, j) indices into states, i < j, of the edges to search. Defaults to every
+                pair of states
+
+        Returns:
+            List[tuple]: the pairs left unsearched because the deadline passed. Empty if every edge was searched
         """
 
-        def record_path(start, end, parent: dict, cost: int):
+        table = self.get_transition_table()
+        # Plain lists index much faster than NumPy arrays inside the search loop
+        offsets = table.offsets.tolist()
+        successors = table.successors.tolist()
+        costs = table.costs.tolist()
+
+        layout_key = self.grid.get_layout_key()
+        # A* heuristic towards each end state and from each start state, by packed index, shared by the searches of
+        # this call
+        goal_heuristics = dict()
+        source_heuristics = dict()
+        # Search bookkeeping is kept in buffers indexed by packed state, copied from these templates for every search.
+        # g stays a list, which indexes faster than an array inside the search loop
+        unvisited_g = [math.inf] * table.num_states
+        no_parent = array("i", [-1]) * table.num_states
+
+        def edge_key(start, end):
+            return (
+                layout_key,
+                self.big_turn,
+                (start.x, start.y, start.direction),
+                (end.x, end.y, end.direction),
+            )
+
+        def store_path(start, end, cost: int, path: list):
 
             # Update cost table for the (start,end) and (end,start) edges
             self.cost_table[(start, end)] = cost
             self.cost_table[(end, start)] = cost
 
+            # Update path table for the (start,end) and (end,start) edges, with the (end,start) edge being the reversed path
+            self.path_table[(start, end)] = list(path)
+            self.path_table[(end, start)] = path[::-1]
+
+        def record_path(start, end, parent: array, cost: int):
+
             path = []
-            cursor = (end.x, end.y, end.direction)
+            cursor = table.encode(end.x, end.y, end.direction)
 
-            while cursor in parent:
-                path.append(cursor)
+            while parent[cursor] != -1:
+                path.append(table.decode(cursor))
                 cursor = parent[cursor]
 
-            path.append(cursor)
+            path.append(table.decode(cursor))
+            path.reverse()
 
-            # Update path table for the (start,end) and (end,start) edges, with the (start,end) edge being the reversed path
-            self.path_table[(start, end)] = path[::-1]
-            self.path_table[(end, start)] = path
+            record_edge(start, end, cost, path)
+
+        def record_edge(start, end, cost: int, path: list):
+            if self.cache_edges:
+                edge_cache.put(edge_key(start, end), (cost, path))
+            store_path(start, end, cost, path)
+
+        def load_cached_path(start, end) -> bool:
+            # Fill the tables from the edge cache, returns True if the edge was found there (even if it is unreachable)
+            if not self.cache_edges:
+                return False
+
+            cached = edge_cache.get(edge_key(start, end))
+            if cached is LRUCache.MISSING:
+                return False
+
+            if cached is not None:
+                store_path(start, end, *cached)
+            return True
+
+        def record_unreachable(start, end):
+            if self.cache_edges:
+                edge_cache.put(edge_key(start, end), None)
+
+        def get_heuristic_to(end_index: int) -> list:
+            if end_index not in goal_heuristics:
+                goal_heuristics[end_index] = get_goal_heuristic(
+                    self.get_heuristic_table(), table.size_x, table.size_y, end_index
+                )
+            return goal_heuristics[end_index]
+
+        def get_heuristic_from(start_index: int) -> list:
+            if start_index not in source_heuristics:
+                source_heuristics[start_index] = get_source_heuristic(
+                    self.get_heuristic_table(), table.size_x, table.size_y, start_index
+                )
+            return source_heuristics[start_index]
 
         def astar_search(start: CellState, end: CellState):
-            # astar search algo with three states: x, y, direction
+            # astar search algo with three states: x, y, direction, packed into a single index
 
             # If it is already done before, return
-            if (start, end) in self.path_table:
+            if (start, end) in self.path_table or load_cached_path(start, end):
                 return
 
+            start_index = table.encode(start.x, start.y, start.direction)
+            end_index = table.encode(end.x, end.y, end.direction)
+
             # Heuristic to guide the search: 'distance' is calculated by f = g + h
             # g is the actual distance moved so far from the start node to current node
-            # h is the heuristic distance from current node to end node
-            g_distance = {(start.x, start.y, start.direction): 0}
+            # h is the obstacle-free cost from current node to end node, which accounts for the headings and turns
+            heuristic = get_heuristic_to(end_index)
+            g_distance = unvisited_g[:]
+            g_distance[start_index] = 0
 
-            # format of each item in heap: (f_distance of node, x coord of node, y coord of node)
-            # heap in Python is a min-heap
-            heap = [
-                (
-                    self.compute_state_distance(start, end),
-                    start.x,
-                    start.y,
-                    start.direction,
-                )
-            ]
-            parent = dict()
-            visited = set()
+            # format of each item in heap: (f_distance of node, packed index of node)
+            # heap in Python is a min-heap; index order matches (x, y, direction) order
+            heap = [(heuristic[start_index], start_index)]
+            parent = array("i", no_parent)
+            visited = bytearray(table.num_states)
 
             while heap:
                 # Pop the node with the smallest distance
-                _, cur_x, cur_y, cur_direction = heapq.heappop(heap)
+                _, cur = heapq.heappop(heap)
 
-                if (cur_x, cur_y, cur_direction) in visited:
+                if visited[cur]:
                     continue
 
-                if end.is_eq(cur_x, cur_y, cur_direction):
-                    record_path(
-                        start, end, parent, g_distance[(cur_x, cur_y, cur_direction)]
-                    )
+                if cur == end_index:
+                    record_path(start, end, parent, g_distance[cur])
                     return
 
-                visited.add((cur_x, cur_y, cur_direction))
-                cur_distance = g_distance[(cur_x, cur_y, cur_direction)]
+                visited[cur] = 1
+                cur_distance = g_distance[cur]
 
-                for next_x, next_y, new_direction, safe_cost in self.get_neighbors(
-                    cur_x, cur_y, cur_direction
-                ):
-                    if (next_x, next_y, new_direction) in visited:
+                for k in range(offsets[cur], offsets[cur + 1]):
+                    nxt = successors[k]
+                    if visited[nxt]:
                         continue
 
-                    move_cost = (
-                        Direction.rotation_cost(new_direction, cur_direction)
-                        + 1
-                        + safe_cost
-                    )
+                    next_distance = cur_distance + costs[k]
 
-                    # the cost to check if any obstacles that considered too near the robot; if it
-                    # safe_cost =
+                    if g_distance[nxt] > next_distance:
+                        g_distance[nxt] = next_distance
+                        parent[nxt] = cur
 
-                    # new cost is calculated by the cost to reach current state + cost to move from
-                    # current state to new state + heuristic cost from new state to end state
-                    next_cost = (
-                        cur_distance
-                        + move_cost
-                        + self.compute_coord_distance(next_x, next_y, end.x, end.y)
-                    )
+                        # f = cost to reach current state + cost to move from current state to new state + heuristic
+                        # cost from new state to end state
+                        heapq.heappush(heap, (next_distance + heuristic[nxt], nxt))
+
+            # The search closed every state that start reaches
+            table.set_reachable(start_index, visited)
+            record_unreachable(start, end)
 
-                    if (next_x, next_y, new_direction) not in g_distance or g_distance[
-                        (next_x, next_y, new_direction)
-                    ] > cur_distance + move_cost:
-                        g_distance[(next_x, next_y, new_direction)] = (
-                            cur_distance + move_cost
+        def bidirectional_search(start: CellState, end: CellState):
+            # A* forward from start over the successors and backward from end over the predecessors, meeting in the
+            # middle. Backward edges keep the cost of the forward move, so the costs are the same as astar_search
+
+            # If it is already done before, return
+            if (start, end) in self.path_table or load_cached_path(start, end):
+                return
+
+            predecessors = table.get_predecessors()
+            start_index = table.encode(start.x, start.y, start.direction)
+            end_index = table.encode(end.x, end.y, end.direction)
+            heuristic_forward = get_heuristic_to(end_index)
+            heuristic_backward = get_heuristic_from(start_index)
+
+            g_forward = unvisited_g[:]
+            g_forward[start_index] = 0
+            g_backward = unvisited_g[:]
+            g_backward[end_index] = 0
+            parent = array("i", no_parent)
+            # child[s]: next state on the way from s to end
+            child = array("i", no_parent)
+            closed_forward = bytearray(table.num_states)
+            closed_backward = bytearray(table.num_states)
+            heap_forward = [(heuristic_forward[start_index], start_index)]
+            heap_backward = [(heuristic_backward[end_index], end_index)]
+
+            # Cost of the best path found so far and the state where its two halves meet
+            best_cost = 0 if start_index == end_index else math.inf
+            meet = start_index if start_index == end_index else -1
+
+            while heap_forward and heap_backward:
+                # Both heuristics are consistent, so a path not found yet costs at least the smallest key of either
+                # queue, and best_cost is optimal once one of them reaches it
+                if heap_forward[0][0] >= best_cost or heap_backward[0][0] >= best_cost:
+                    break
+
+                # Expand the side with the smaller frontier
+                if len(heap_forward) <= len(heap_backward):
+                    _, cur = heapq.heappop(heap_forward)
+                    if closed_forward[cur]:
+                        continue
+                    closed_forward[cur] = 1
+                    cur_distance = g_forward[cur]
+
+                    for k in range(offsets[cur], offsets[cur + 1]):
+                        nxt = successors[k]
+                        next_distance = cur_distance + costs[k]
+                        if closed_forward[nxt] or g_forward[nxt] <= next_distance:
+                            continue
+
+                        g_forward[nxt] = next_distance
+                        parent[nxt] = cur
+                        heapq.heappush(
+                            heap_forward, (next_distance + heuristic_forward[nxt], nxt)
                         )
-                        parent[(next_x, next_y, new_direction)] = (
-                            cur_x,
-                            cur_y,
-                            cur_direction,
+                        if next_distance + g_backward[nxt] < best_cost:
+                            best_cost = next_distance + g_backward[nxt]
+                            meet = nxt
+                else:
+                    _, cur = heapq.heappop(heap_backward)
+                    if closed_backward[cur]:
+                        continue
+                    closed_backward[cur] = 1
+                    cur_distance = g_backward[cur]
+
+                    for prev, cost in predecessors[cur]:
+                        prev_distance = cur_distance + cost
+                        if closed_backward[prev] or g_backward[prev] <= prev_distance:
+                            continue
+
+                        g_backward[prev] = prev_distance
+                        child[prev] = cur
+                        heapq.heappush(
+                            heap_backward, (prev_distance + heuristic_backward[prev], prev)
                         )
+                        if prev_distance + g_forward[prev] < best_cost:
+                            best_cost = prev_distance + g_forward[prev]
+                            meet = prev
+
+            if meet == -1:
+                record_unreachable(start, end)
+                return
+
+            path = []
+            cursor = meet
+            while cursor != -1:
+                path.append(cursor)
+                cursor = parent[cursor]
+            path.reverse()
+            cursor = child[meet]
+            while cursor != -1:
+                path.append(cursor)
+                cursor = child[cursor]
+
+            record_edge(start, end, best_cost, [table.decode(state) for state in path])
+
+        def dijkstra_search(start: CellState, ends: List[CellState]):
+            # single source search from start, stopping once every end state not yet in the path table is settled
+            targets = dict()
+            for end in ends:
+                if (start, end) not in self.path_table and not load_cached_path(
+                    start, end
+                ):
+                    targets.setdefault(
+                        table.encode(end.x, end.y, end.direction), []
+                    ).append(end)
+
+            if not targets:
+                return
+
+            start_index = table.encode(start.x, start.y, start.direction)
+            g_distance = unvisited_g[:]
+            g_distance[start_index] = 0
+            heap = [(0, start_index)]
+            parent = array("i", no_parent)
+            visited = bytearray(table.num_states)
+
+            while heap:
+                cur_distance, cur = heapq.heappop(heap)
+
+                if visited[cur]:
+                    continue
 
-                        heapq.heappush(heap, (next_cost, next_x, next_y, new_direction))
+                visited[cur] = 1
+
+                # The start state and the parent tree are shared by all targets settled at this state
+                if cur in targets:
+                    for end in targets.pop(cur):
+                        record_path(start, end, parent, cur_distance)
+                    if not targets:
+                        return
+
+                for k in range(offsets[cur], offsets[cur + 1]):
+                    nxt = successors[k]
+                    if visited[nxt]:
+                        continue
+
+                    next_distance = cur_distance + costs[k]
+                    if g_distance[nxt] > next_distance:
+                        g_distance[nxt] = next_distance
+                        parent[nxt] = cur
+
+                        heapq.heappush(heap, (next_distance, nxt))
+
+            for remaining in targets.values():
+                for end in remaining:
+                    record_unreachable(start, end)
+
+        def incremental_search(start: CellState, ends: List[CellState]):
+            # like dijkstra_search, but the search from start is kept and reused after the obstacles change
+            targets = dict()
+            for end in ends:
+                if (start, end) not in self.path_table and not load_cached_path(
+                    start, end
+                ):
+                    targets.setdefault(
+                        table.encode(end.x, end.y, end.direction), []
+                    ).append(end)
+
+            if not targets:
+                return
+
+            start_index = table.encode(start.x, start.y, start.direction)
+            if start_index not in self.incremental_searches:
+                self.incremental_searches[start_index] = IncrementalSearch(
+                    table, start_index
+                )
+            search = self.incremental_searches[start_index]
+            search.compute(targets)
+
+            for end_index, remaining in targets.items():
+                path = search.get_path(end_index)
+                for end in remaining:
+                    if path is None:
+                        record_unreachable(start, end)
+                    else:
+                        record_edge(
+                            start,
+                            end,
+                            search.get_cost(end_index),
+                            [table.decode(state) for state in path],
+                        )
 
-        # Nested loop through all the state pairings
-        for i in range(len(states) - 1):
-            for j in range(i + 1, len(states)):
-                astar_search(states[i], states[j])
+        def timed_out() -> bool:
+            return deadline is not None and time.monotonic() > deadline
+
+        if pairs is None:
+            pairs = [(i, j) for i in range(len(states) - 1) for j in range(i + 1, len(states))]
+
+        if self.search_mode in ("incremental", "dijkstra"):
+            # One-to-many: a single search from each state settles all of its end states
+            search = incremental_search if self.search_mode == "incremental" else dijkstra_search
+            ends = dict()
+            for i, j in pairs:
+                ends.setdefault(i, []).append(j)
+            for i, js in list(ends.items()):
+                if timed_out():
+                    return [(a, b) for a, b in pairs if a in ends]
+                search(states[i], [states[j] for j in js])
+                del ends[i]
+            return []
+
+        search = bidirectional_search if self.search_mode == "bidirectional" else astar_search
+        # Loop through all the state pairings
+        for k, (i, j) in enumerate(pairs):
+            if timed_out():
+                return pairs[k:]
+            search(states[i], states[j])
+        return []
 
 
 if __name__ == "__main__":
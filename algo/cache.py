@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from consts import EDGE_CACHE_SIZE, SOLUTION_CACHE_PATH, SOLUTION_CACHE_SIZE
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with a fixed number of entries"""
+
+    # Returned by `get` on a miss, so that None can be cached as a value
+    MISSING = object()
+
+    def __init__(self, maxsize: int):
+        """
+        Args:
+            maxsize (int): Maximum number of entries kept before the least recently used one is evicted
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Look up a key and mark it as most recently used
+
+        Returns:
+            Any: cached value, or LRUCache.MISSING if the key is not cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return self.MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def add_counts(self, hits: int, misses: int):
+        """Add lookups counted by a copy of this cache in another process, such as a worker of the planning pool"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SolutionCache:
+    """Cache of whole /path solutions, with an in-memory LRU tier and an optional SQLite tier that survives restarts.
+    Values must be JSON serialisable.
+    """
+
+    # Part of every key, to be bumped when a change to the planner makes stored solutions outdated
+    VERSION = 1
+
+    def __init__(self, maxsize: int, path: str = None):
+        """
+        Args:
+            maxsize (int): Maximum number of solutions kept in memory
+            path (str, optional): SQLite file of the on-disk tier. Defaults to None, for no on-disk tier.
+        """
+        self.memory = LRUCache(maxsize)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path = path
+        self._connection = None
+        self._pid = None
+
+    def _get_connection(self):
+        """Connection to the on-disk tier, opened on first use in each process. A connection is never used across a
+        fork: a child process opens its own. Must be called with the lock held.
+
+        Returns:
+            sqlite3.Connection: connection, or None if there is no on-disk tier
+        """
+        if self.path is None:
+            return None
+        if self._pid != os.getpid():
+            # One connection shared by the request threads of this process, serialised by the lock
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+                )
+        return self._connection
+
+    @classmethod
+    def make_key(
+        cls,
+        obstacles: list,
+        robot_x: int,
+        robot_y: int,
+        robot_direction: int,
+        big_turn: int,
+        retrying: bool,
+        size_x: int,
+        size_y: int,
+    ) -> str:
+        """Canonical hash of a /path request: the same obstacles in any order give the same key
+
+        Args:
+            obstacles (list): obstacles as dictionaries with keys "x", "y", "d" and "id"
+
+        Returns:
+            str: hex digest of the request
+        """
+        canonical = {
+            "version": cls.VERSION,
+            "size": [size_x, size_y],
+            "obstacles": sorted(
+                [int(ob["x"]), int(ob["y"]), int(ob["d"]), int(ob["id"])] for ob in obstacles
+            ),
+            "robot": [int(robot_x), int(robot_y), int(robot_direction)],
+            "big_turn": int(big_turn),
+            "retrying": bool(retrying),
+        }
+        return hashlib.sha256(
+            json.dumps(canonical, separators=(",", ":")).encode()
+        ).hexdigest()
+
+    def get(self, key: str):
+        """Look up a solution in memory, then on disk
+
+        Returns:
+            Any: cached solution, or None on a miss
+        """
+        value = self.memory.get(key)
+        if value is not LRUCache.MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        row = None
+        with self._lock:
+            connection = self._get_connection()
+            if connection is not None:
+                row = connection.execute(
+                    "SELECT value FROM solutions WHERE key = ?", (key,)
+                ).fetchone()
+        if row is not None:
+            value = json.loads(row[0])
+            self.memory.put(key, value)
+            with self._lock:
+                self.disk_hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value):
+        self.memory.put(key, value)
+        with self._lock:
+            connection = self._get_connection()
+            if connection is not None:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO solutions (key, value) VALUES (?, ?)",
+                        (key, json.dumps(value)),
+                    )
+
+    def clear(self):
+        """Drop every solution from both tiers and reset the counters"""
+        self.memory.clear()
+        with self._lock:
+            connection = self._get_connection()
+            if connection is not None:
+                with connection:
+                    connection.execute("DELETE FROM solutions")
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.memory),
+            "maxsize": self.memory.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+# Process-wide cache of search results, shared by every MazeSolver
+# key: (obstacle layout, big_turn, (x, y, d) of start, (x, y, d) of end)
+# value: (cost, path from start to end) or None if end cannot be reached from start
+edge_cache = LRUCache(EDGE_CACHE_SIZE)
+
+# Process-wide cache of /path solutions, keyed by `SolutionCache.make_key`
+solution_cache = SolutionCache(SOLUTION_CACHE_SIZE, SOLUTION_CACHE_PATH)
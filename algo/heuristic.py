@@ -0,0 +1,83 @@
+import heapq
+import threading
+import numpy as np
+
+# Heuristic tables by (big_turn, size_x, size_y), built on first use
+_tables = dict()
+_tables_lock = threading.Lock()
+
+
+def build_heuristic_table(candidates, size_x: int, size_y: int) -> np.ndarray:
+    """Exact cost of every relative move on an arena without obstacles and walls
+
+    Any path of the arena stays within (size_x - 1, size_y - 1) of its start on both axes and costs at least as much
+    as in this relaxation (the moves are the same, minus the obstacle checks and the safe costs), so the table is an
+    admissible and consistent A* heuristic.
+
+    Args:
+        candidates (List[List[tuple]]): (dx, dy, new_direction, is_turn, cost) of each move, by direction index
+        size_x (int): width of the arena
+        size_y (int): height of the arena
+
+    Returns:
+        np.ndarray: table[d0, dx + size_x - 1, dy + size_y - 1, d1], the cost from heading d0 to the state offset by
+            (dx, dy) with heading d1, where headings are direction indices (direction // 2)
+    """
+    width, height = 2 * size_x - 1, 2 * size_y - 1
+    table = np.full((4, width, height, 4), np.inf)
+
+    for d0 in range(4):
+        distance = table[d0]
+        distance[size_x - 1, size_y - 1, d0] = 0
+        heap = [(0, size_x - 1, size_y - 1, d0)]
+        while heap:
+            cost, x, y, d = heapq.heappop(heap)
+            if cost > distance[x, y, d]:
+                continue
+            for dx, dy, new_direction, _, move_cost in candidates[d]:
+                nx, ny, nd = x + dx, y + dy, new_direction // 2
+                if 0 <= nx < width and 0 <= ny < height and cost + move_cost < distance[nx, ny, nd]:
+                    distance[nx, ny, nd] = cost + move_cost
+                    heapq.heappush(heap, (cost + move_cost, nx, ny, nd))
+
+    return table
+
+
+def get_heuristic_table(big_turn: int, candidates, size_x: int, size_y: int) -> np.ndarray:
+    """Returns the process-wide heuristic table of a turn setting and arena size, building it on first use"""
+    key = (big_turn, size_x, size_y)
+    with _tables_lock:
+        if key not in _tables:
+            _tables[key] = build_heuristic_table(candidates, size_x, size_y)
+        return _tables[key]
+
+
+def _decode_states(size_x: int, size_y: int, index):
+    """(x, y, direction index) of packed state indices, as in `TransitionTable`"""
+    return index // (4 * size_y), index // 4 % size_y, index % 4
+
+
+def get_goal_heuristic(table: np.ndarray, size_x: int, size_y: int, goal_index: int) -> list:
+    """Heuristic of every packed state towards one goal state
+
+    Args:
+        table (np.ndarray): heuristic table from `build_heuristic_table`
+        size_x (int): width of the arena
+        size_y (int): height of the arena
+        goal_index (int): packed index of the goal state
+
+    Returns:
+        list: heuristic by packed state index, as a list for fast lookups in the search loop
+    """
+    xs, ys, ds = _decode_states(size_x, size_y, np.arange(size_x * size_y * 4))
+    goal_x, goal_y, goal_d = _decode_states(size_x, size_y, goal_index)
+    return table[ds, goal_x - xs + size_x - 1, goal_y - ys + size_y - 1, goal_d].tolist()
+
+
+def get_source_heuristic(table: np.ndarray, size_x: int, size_y: int, source_index: int) -> list:
+    """Heuristic of every packed state from one source state, for searches running backwards to the source. Same
+    arguments as `get_goal_heuristic`
+    """
+    xs, ys, ds = _decode_states(size_x, size_y, np.arange(size_x * size_y * 4))
+    source_x, source_y, source_d = _decode_states(size_x, size_y, source_index)
+    return table[source_d, xs - source_x + size_x - 1, ys - source_y + size_y - 1, ds].tolist()
@@ -0,0 +1,160 @@
+import heapq
+import math
+from typing import Iterable, List, Optional
+
+
+class IncrementalSearch:
+    """Lifelong Planning A* from one source state over a TransitionTable, with a zero heuristic so that a single search
+    serves many targets. The search state (g, rhs and the priority queue) is kept between calls, and after the
+    transition table changes only the states whose distance is affected by the changed edges are expanded again.
+
+    States and the table use the packed indices of `TransitionTable`.
+    """
+
+    def __init__(self, table, source: int):
+        """
+        Args:
+            table (TransitionTable): transition table of the current obstacle layout
+            source (int): packed index of the source state
+        """
+        self.table = table
+        self.source = source
+        # g: settled distance, rhs: one step lookahead distance. A state is consistent when both are equal
+        self.g = [math.inf] * table.num_states
+        self.rhs = [math.inf] * table.num_states
+        self.rhs[source] = 0
+        # Lazy priority queue of (key, state), entries whose key is outdated are skipped when popped
+        self.heap = [(0, source)]
+
+    def _key(self, state: int):
+        return min(self.g[state], self.rhs[state])
+
+    def _update_state(self, state: int):
+        if state != self.source:
+            g = self.g
+            self.rhs[state] = min(
+                (g[pred] + cost for pred, cost in self.table.get_predecessors()[state]),
+                default=math.inf,
+            )
+        if self.g[state] != self.rhs[state]:
+            heapq.heappush(self.heap, (self._key(state), state))
+
+    def compute(self, targets: Iterable[int]):
+        """Expand inconsistent states until every target has its final distance
+
+        Args:
+            targets (Iterable[int]): packed indices of the states to reach
+        """
+        g, rhs, heap, source = self.g, self.rhs, self.heap, self.source
+        adjacency = self.table.get_adjacency()
+        # Targets whose distance may still change. Keys are popped in nondecreasing order, so a target that is
+        # consistent with a distance no larger than the key at the top of the queue is final
+        pending = list(targets)
+        last_key = None
+
+        while heap:
+            key, state = heap[0]
+            g_state, rhs_state = g[state], rhs[state]
+            if g_state == rhs_state or key != (g_state if g_state < rhs_state else rhs_state):
+                heapq.heappop(heap)
+                continue
+
+            # The pending targets are only checked again when the key at the top of the queue changes
+            if key != last_key:
+                pending = [t for t in pending if g[t] != rhs[t] or g[t] > key]
+                if not pending:
+                    return
+                last_key = key
+
+            heapq.heappop(heap)
+            if g_state > rhs_state:
+                # Overconsistent: settle the state, which can only lower the rhs of its successors
+                g[state] = rhs_state
+                for succ, cost in adjacency[state]:
+                    distance = rhs_state + cost
+                    if distance < rhs[succ] and succ != source:
+                        rhs[succ] = distance
+                        heapq.heappush(heap, (distance if distance < g[succ] else g[succ], succ))
+            else:
+                # Underconsistent: reset the state and recompute the successors that depended on it
+                g[state] = math.inf
+                self._update_state(state)
+                for succ, cost in adjacency[state]:
+                    if rhs[succ] == g_state + cost:
+                        self._update_state(succ)
+
+    def get_cost(self, target: int) -> float:
+        return self.g[target]
+
+    def get_path(self, target: int) -> Optional[List[int]]:
+        """Returns the packed states of a shortest path from the source to a target, None if it cannot be reached.
+        Only valid for targets passed to the last `compute` call.
+        """
+        if math.isinf(self.g[target]):
+            return None
+
+        g = self.g
+        predecessors = self.table.get_predecessors()
+        path = [target]
+        state = target
+        while state != self.source:
+            # Step back along any edge that is tight with respect to g
+            state = next(
+                pred for pred, cost in predecessors[state] if g[pred] + cost == g[state]
+            )
+            path.append(state)
+
+        path.reverse()
+        return path
+
+    def update_table(self, table, affected_states: List[int], worsened_states: List[int] = ()):
+        """Switch to the transition table of a new obstacle layout and queue the states whose distance may have changed
+
+        Every settled state whose shortest path may go through a worsened state is reset at once, by following the
+        edges that were tight with respect to g, instead of one state at a time through the priority queue. The reset
+        states and the affected states then get their rhs from their predecessors in the new table.
+
+        Args:
+            table (TransitionTable): transition table of the new obstacle layout
+            affected_states (List[int]): states with an incoming edge added, removed or changed in cost
+            worsened_states (List[int], optional): states whose incoming edges, or turns out of them, were removed or
+                became dearer
+        """
+        g, source = self.g, self.source
+        old_adjacency = self.table.get_adjacency()
+        self.table = table
+
+        # Unsettled states next to the reset region may have their lookahead from a reset state, and the edges into
+        # the affected states changed, so their rhs is computed again, as is that of the reset states
+        recompute = set(affected_states)
+        reset = set()
+        stack = [state for state in worsened_states if not math.isinf(g[state])]
+        while stack:
+            state = stack.pop()
+            if state != source:
+                reset.add(state)
+            for succ, cost in old_adjacency[state]:
+                if g[succ] == g[state] + cost:
+                    if succ not in reset and succ != source:
+                        reset.add(succ)
+                        stack.append(succ)
+                elif math.isinf(g[succ]):
+                    recompute.add(succ)
+
+        rhs = self.rhs
+        for state in reset:
+            g[state] = rhs[state] = math.inf
+        recompute.update(reset)
+        recompute.discard(source)
+
+        predecessors = table.get_predecessors()
+        heap = self.heap
+        for state in sorted(recompute):
+            best = math.inf
+            for pred, cost in predecessors[state]:
+                distance = g[pred] + cost
+                if distance < best:
+                    best = distance
+            rhs[state] = best
+            if g[state] != best:
+                heapq.heappush(heap, (best if best < g[state] else g[state], state))
@@ -0,0 +1,110 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+import numpy as np
+from algo.tsp import solve_tsp_subsets
+
+# Process pools by number of workers, kept for the life of the process so that /path calls do not pay the start up
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Returns the shared process pool with the given number of workers, creating it on first use"""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _pools[workers]
+
+
+def _share_array(array: np.ndarray):
+    """Copy an array into a new shared memory block
+
+    Returns:
+        Tuple[SharedMemory, tuple]: the block, which the caller must unlink, and the spec to attach to it
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _read_shared_array(spec, start=None, stop=None) -> np.ndarray:
+    """Copy (a slice of the first axis of) an array out of a shared memory block"""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.array(np.ndarray(shape, dtype=dtype, buffer=shm.buf)[start:stop])
+    finally:
+        shm.close()
+
+
+def _solve_tsp_subsets_worker(
+    matrix_spec, subsets_spec, fixed_costs_spec, start, stop, batch_size, deadline
+):
+    best, cost, order, completed, pruned = solve_tsp_subsets(
+        _read_shared_array(matrix_spec),
+        _read_shared_array(subsets_spec, start, stop),
+        _read_shared_array(fixed_costs_spec, start, stop),
+        batch_size,
+        deadline,
+    )
+    return (start + best if best != -1 else -1), cost, order, completed, pruned
+
+
+def solve_tsp_subsets_parallel(
+    distance_matrix: np.ndarray,
+    subsets: np.ndarray,
+    fixed_costs: np.ndarray,
+    workers: int,
+    batch_size: int,
+    deadline: Optional[float] = None,
+) -> Tuple[int, float, List[int], bool, int]:
+    """Same as `solve_tsp_subsets`, with the subsets split into contiguous ranges over a process pool. The inputs are
+    passed to the workers through shared memory, every worker returns the best subset of its range, and the results
+    are reduced by (cost, index), so the output is identical to the serial one. Each worker prunes against its own
+    best subset only, so the pruned count can be lower than the serial one.
+    """
+    if len(subsets) <= batch_size:
+        return solve_tsp_subsets(
+            distance_matrix, subsets, fixed_costs, batch_size, deadline
+        )
+
+    bounds = np.linspace(0, len(subsets), workers + 1).astype(int)
+    blocks = []
+    try:
+        specs = []
+        for array in (distance_matrix, subsets, fixed_costs):
+            shm, spec = _share_array(np.ascontiguousarray(array))
+            blocks.append(shm)
+            specs.append(spec)
+
+        pool = get_process_pool(workers)
+        futures = [
+            pool.submit(
+                _solve_tsp_subsets_worker,
+                *specs,
+                int(start),
+                int(stop),
+                batch_size,
+                deadline,
+            )
+            for start, stop in zip(bounds[:-1], bounds[1:])
+            if start < stop
+        ]
+        results = [future.result() for future in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    completed = all(result[3] for result in results)
+    pruned = sum(result[4] for result in results)
+    feasible = [result for result in results if result[0] != -1]
+    if not feasible:
+        return -1, 1e9, [], completed, pruned
+
+    best, cost, order, _, _ = min(
+        feasible, key=lambda result: (result[1], result[0])
+    )
+    return best, cost, order, completed, pruned
@@ -0,0 +1,140 @@
+import time
+from algo.algo import MazeSolver
+from algo.cache import SolutionCache, edge_cache, solution_cache
+from algo.helper import command_generator
+from consts import Direction, WIDTH, HEIGHT
+from metrics import StageTimer
+
+
+def plan_path(
+    obstacles: list,
+    robot_x: int,
+    robot_y: int,
+    robot_direction: Direction,
+    retrying: bool,
+    big_turn=0,
+    deadline=None,
+    timer=None,
+    executor=None,
+) -> dict:
+    """Plan the path visiting the obstacles of a /path request, or serve it from the solution cache
+
+    Args:
+        obstacles (list): obstacles as dictionaries with keys "x", "y", "d" and "id"
+        robot_x (int): x of the robot's start state
+        robot_y (int): y of the robot's start state
+        robot_direction (Direction): direction of the robot's start state
+        retrying (bool): passed on to the view state generation
+        big_turn (int, optional): turn setting of the solver. Defaults to 0.
+        deadline (float, optional): time.monotonic() value by which to answer, see `get_optimal_order_anytime`
+        timer (StageTimer, optional): receives the time spent in each stage
+        executor (BoundedExecutor, optional): executor solving cache misses, in the calling thread if None
+
+    Returns:
+        dict: the "data" of the /path response, with keys "distance", "path", "commands", "proven_optimal" and "cached".
+            The dictionary is a copy, so it can be extended by the caller
+
+    Raises:
+        ExecutorBusyError: if the executor cannot take the request
+    """
+    start = time.perf_counter()
+    cache_key = SolutionCache.make_key(
+        obstacles, robot_x, robot_y, robot_direction, big_turn, retrying, WIDTH, HEIGHT
+    )
+    solution = solution_cache.get(cache_key)
+    if timer is not None:
+        timer.record("cache", time.perf_counter() - start)
+    if solution is not None:
+        return dict(solution, cached=True)
+
+    args = (obstacles, robot_x, robot_y, robot_direction, retrying, big_turn, deadline)
+    if executor is None:
+        solution = solve_path(*args, timer=timer)
+    else:
+        # Timers cannot be sent to worker processes, so the stages come back as milliseconds. Each worker has its own
+        # edge cache, whose lookups are added to the counters of this process's
+        solution, timings, (edge_hits, edge_misses) = executor.run(
+            solve_path_job, *args
+        )
+        edge_cache.add_counts(edge_hits, edge_misses)
+        if timer is not None:
+            for stage, milliseconds in timings.items():
+                timer.record(stage, milliseconds / 1000)
+
+    # A solution cut short by the deadline may be improved by a later request, so only optimal ones are kept
+    if solution["proven_optimal"]:
+        solution_cache.put(cache_key, solution)
+    return dict(solution, cached=False)
+
+
+def solve_path(
+    obstacles: list,
+    robot_x: int,
+    robot_y: int,
+    robot_direction: Direction,
+    retrying: bool,
+    big_turn=0,
+    deadline=None,
+    timer=None,
+) -> dict:
+    """Solve a /path request, without the solution cache. Same arguments as `plan_path`
+
+    Returns:
+        dict: the "data" of the /path response, with keys "distance", "path", "commands" and "proven_optimal"
+    """
+    # Initialize MazeSolver object with robot size of 20x20, bottom left corner of robot at (1,1), facing north, and whether to use a big turn or not.
+    maze_solver = MazeSolver(
+        WIDTH, HEIGHT, robot_x, robot_y, robot_direction, big_turn=big_turn
+    )
+
+    # Add each obstacle into the MazeSolver. Each obstacle is defined by its x,y positions, its direction, and its id
+    for ob in obstacles:
+        maze_solver.add_obstacle(ob["x"], ob["y"], ob["d"], ob["id"])
+
+    # Get shortest path. The time it takes is in maze_solver.timings, and the distance in the response
+    optimal_path, distance, proven_optimal = maze_solver.get_optimal_order_anytime(
+        retrying=retrying, deadline=deadline
+    )
+
+    # Based on the shortest path, generate commands for the robot
+    start = time.perf_counter()
+    commands = command_generator(optimal_path, obstacles)
+    if timer is not None:
+        # View states, A* edges and ordering, as timed by the solver
+        for stage, seconds in maze_solver.timings.items():
+            timer.record(stage, seconds)
+        timer.record("commands", time.perf_counter() - start)
+
+    # Get the starting location and add it to path_results
+    path_results = [optimal_path[0].get_dict()]
+    # Process each command individually and append the location the robot should be after executing that command to path_results
+    i = 0
+    for command in commands:
+        if command.startswith("SNAP") or command.startswith("SSSSS"):
+            continue
+        elif command.startswith("FW") or command.startswith("BW"):
+            compressed = int(command[-3:]) // 10
+            i += compressed
+        else:
+            i += 1
+        path_results.append(optimal_path[i].get_dict())
+
+    return {
+        "distance": distance,
+        "path": path_results,
+        "commands": commands,
+        "proven_optimal": proven_optimal,
+    }
+
+
+def solve_path_job(*args):
+    """`solve_path` for worker processes
+
+    Returns:
+        Tuple[dict, dict, Tuple[int, int]]: the solution, the milliseconds spent in each stage, and the hits and misses
+            of the worker's edge cache during the solve
+    """
+    timer = StageTimer()
+    hits, misses = edge_cache.hits, edge_cache.misses
+    solution = solve_path(*args, timer=timer)
+    return solution, timer.timings, (edge_cache.hits - hits, edge_cache.misses - misses)
@@ -0,0 +1,550 @@
+import random
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def _gtsp_dynamic_programming_steps(
+    distance_matrix: np.ndarray, groups: List[np.ndarray], penalties: np.ndarray
+):
+    """Fill the (mask of visited groups, current node) table shared by the GTSP solvers, one mask at a time. The
+    generator yields before every mask, so that its caller can stop or pause it, and returns the finished table.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: dp[mask, v], the cheapest path from node 0 visiting one node of every group in
+            mask and ending at v (np.inf if there is none), and the predecessor of v on that path
+    """
+    n_groups = len(groups)
+    n = distance_matrix.shape[0]
+
+    dp = np.full((1 << n_groups, n), np.inf)
+    parent = np.full((1 << n_groups, n), -1, dtype=np.int64)
+    dp[0, 0] = 0
+
+    for mask in range(1 << n_groups):
+        yield
+
+        active = np.flatnonzero(np.isfinite(dp[mask]))
+        if active.size == 0:
+            continue
+
+        for g, nodes in enumerate(groups):
+            if mask >> g & 1 or nodes.size == 0:
+                continue
+
+            # Best predecessor for every node of group g
+            candidates = dp[mask, active][:, None] + distance_matrix[np.ix_(active, nodes)]
+            best = candidates.argmin(axis=0)
+            cost = candidates[best, np.arange(nodes.size)] + penalties[nodes]
+
+            # Every (next_mask, node) entry has a single possible predecessor mask, so it is written once
+            next_mask = mask | 1 << g
+            dp[next_mask, nodes] = cost
+            parent[next_mask, nodes] = active[best]
+
+    return dp, parent
+
+
+def _gtsp_dynamic_programming_table(
+    distance_matrix: np.ndarray,
+    groups: List[np.ndarray],
+    penalties: np.ndarray,
+    deadline: Optional[float] = None,
+):
+    """Fill the table of `_gtsp_dynamic_programming_steps` in one go
+
+    Raises:
+        TimeoutError: if the deadline passes before the table is complete
+    """
+    steps = _gtsp_dynamic_programming_steps(distance_matrix, groups, penalties)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("GTSP dynamic program did not finish before the deadline")
+
+
+def _gtsp_backtrack(
+    parent: np.ndarray, groups: List[np.ndarray], mask: int, end: int
+) -> List[int]:
+    """Walk the parent pointers of the GTSP table back from (mask, end) to the start"""
+    node_group = dict()
+    for g, nodes in enumerate(groups):
+        for node in nodes.tolist():
+            node_group[node] = g
+
+    order = [end]
+    node = end
+    while node != 0:
+        prev = int(parent[mask, node])
+        mask ^= 1 << node_group[node]
+        node = prev
+        order.append(node)
+
+    return order[::-1]
+
+
+def solve_gtsp_dynamic_programming(
+    distance_matrix: np.ndarray,
+    groups: List[List[int]],
+    penalties: np.ndarray,
+    deadline: Optional[float] = None,
+) -> Tuple[List[int], float]:
+    """Exact generalized TSP over an open path starting at node 0: visit exactly one node of every group, minimising
+    the sum of edge costs and node penalties. The DP state is (mask of visited groups, current node), so the node of
+    each group and the visiting order are chosen together.
+
+    Args:
+        distance_matrix (np.ndarray): (n, n) edge costs, np.inf for edges that cannot be travelled. Node 0 is the start
+        groups (List[List[int]]): nodes of each group, node 0 must not belong to any group
+        penalties (np.ndarray): (n,) cost added when a node is visited
+        deadline (float, optional): time.monotonic() value after which the search is abandoned
+
+    Returns:
+        Tuple[List[int], float]: visiting order starting with node 0 and its total cost, or ([], np.inf) if no feasible path exists
+
+    Raises:
+        TimeoutError: if the deadline passes before the DP completes
+    """
+    if any(len(nodes) == 0 for nodes in groups):
+        return [], np.inf
+
+    groups = [np.asarray(nodes, dtype=np.int64) for nodes in groups]
+    dp, parent = _gtsp_dynamic_programming_table(
+        distance_matrix, groups, penalties, deadline
+    )
+
+    return _gtsp_best_path(dp, parent, groups)
+
+
+def _gtsp_best_path(
+    dp: np.ndarray, parent: np.ndarray, groups: List[np.ndarray]
+) -> Tuple[List[int], float]:
+    """Cheapest path visiting every group in a finished GTSP table, or ([], np.inf) if there is none"""
+    full = (1 << len(groups)) - 1
+    end = int(dp[full].argmin())
+    distance = float(dp[full, end])
+    if not np.isfinite(distance):
+        return [], np.inf
+
+    return _gtsp_backtrack(parent, groups, full, end), distance
+
+
+def solve_gtsp_prize_collecting(
+    distance_matrix: np.ndarray,
+    groups: List[List[int]],
+    penalties: np.ndarray,
+) -> Tuple[List[int], float, int]:
+    """Prize-collecting variant of `solve_gtsp_dynamic_programming`: visit as many groups as possible, and among the
+    paths visiting the most groups take the cheapest. The DP table covers every subset of groups, so a single run
+    answers all of them. Groups without nodes are never visited.
+
+    Returns:
+        Tuple[List[int], float, int]: visiting order starting with node 0, its total cost, and the number of groups visited
+    """
+    groups = [np.asarray(nodes, dtype=np.int64) for nodes in groups]
+    dp, parent = _gtsp_dynamic_programming_table(distance_matrix, groups, penalties)
+
+    # Cheapest path of every subset, then the most groups visited first and the lowest cost second
+    best_costs = dp.min(axis=1)
+    masks = np.flatnonzero(np.isfinite(best_costs))
+    visited = np.array([bin(mask).count("1") for mask in masks.tolist()])
+    mask = int(masks[np.lexsort((best_costs[masks], -visited))[0]])
+
+    end = int(dp[mask].argmin())
+    return (
+        _gtsp_backtrack(parent, groups, mask, end),
+        float(dp[mask, end]),
+        bin(mask).count("1"),
+    )
+
+
+def get_path_cost(
+    distance_matrix: np.ndarray, penalties: np.ndarray, order: List[int]
+) -> float:
+    """Total cost of an open path: its edge costs plus the penalties of the visited nodes"""
+    return float(
+        distance_matrix[order[:-1], order[1:]].sum() + penalties[order[1:]].sum()
+    )
+
+
+def is_disconnected(distance_matrix: np.ndarray, groups: List[List[int]]) -> bool:
+    """Whether node 0 and the groups, each merged into one node, fall apart into several components over the edges
+    below 1e9 in either direction. The free edges back to node 0 do not count. No path visits every group then, so
+    the solvers need not run.
+    """
+    members = [[0]] + groups
+    connected = distance_matrix < 1e9
+    connected[:, 0] = False
+    connected = connected | connected.T
+    reached = {0}
+    stack = [0]
+    while stack:
+        g = stack.pop()
+        for h in range(len(members)):
+            if h not in reached and connected[np.ix_(members[g], members[h])].any():
+                reached.add(h)
+                stack.append(h)
+    return len(reached) < len(members)
+
+
+def solve_gtsp_local_search(
+    distance_matrix: np.ndarray,
+    groups: List[List[int]],
+    penalties: np.ndarray,
+    deadline: Optional[float] = None,
+) -> Tuple[List[int], float]:
+    """Fast heuristic for the generalized TSP of `solve_gtsp_dynamic_programming`: a nearest neighbour path, improved
+    by node reselection, 2-opt and Or-opt moves until no move helps or the deadline passes.
+
+    Returns:
+        Tuple[List[int], float]: visiting order starting with node 0 and its total cost, or ([], np.inf) if no feasible path was found
+    """
+    if any(len(nodes) == 0 for nodes in groups):
+        return [], np.inf
+
+    node_group = {node: g for g, nodes in enumerate(groups) for node in nodes}
+
+    # Nearest neighbour: repeatedly move to the cheapest node of a group that is not visited yet
+    order = [0]
+    remaining = set(range(len(groups)))
+    while remaining:
+        cur = order[-1]
+        best, best_cost = None, np.inf
+        for g in sorted(remaining):
+            for node in groups[g]:
+                cost = distance_matrix[cur, node] + penalties[node]
+                if cost < best_cost:
+                    best, best_cost = node, cost
+        if best is None:
+            return [], np.inf
+        order.append(best)
+        remaining.remove(node_group[best])
+
+    return improve_gtsp_path(distance_matrix, groups, penalties, order, deadline)
+
+
+def improve_gtsp_path(
+    distance_matrix: np.ndarray,
+    groups: List[List[int]],
+    penalties: np.ndarray,
+    order: List[int],
+    deadline: Optional[float] = None,
+) -> Tuple[List[int], float]:
+    """Improve a generalized TSP path by node reselection, 2-opt and Or-opt moves, taking the first move that helps,
+    until no move helps or the deadline passes
+
+    Returns:
+        Tuple[List[int], float]: the improved visiting order and its total cost
+    """
+    node_group = {node: g for g, nodes in enumerate(groups) for node in nodes}
+    best_cost = get_path_cost(distance_matrix, penalties, order)
+
+    def candidates(order):
+        # Node reselection: swap the node visited for a group with another node of the same group
+        for i in range(1, len(order)):
+            for node in groups[node_group[order[i]]]:
+                if node != order[i]:
+                    yield order[:i] + [node] + order[i + 1 :]
+        # 2-opt: reverse a segment of the path
+        for i in range(1, len(order) - 1):
+            for j in range(i + 1, len(order)):
+                yield order[:i] + order[i : j + 1][::-1] + order[j + 1 :]
+        # Or-opt: move a segment of up to 3 nodes elsewhere
+        for length in range(1, 4):
+            for i in range(1, len(order) - length + 1):
+                segment = order[i : i + length]
+                rest = order[:i] + order[i + length :]
+                for j in range(1, len(rest) + 1):
+                    if j != i:
+                        yield rest[:j] + segment + rest[j:]
+
+    improved = True
+    while improved:
+        improved = False
+        for candidate in candidates(order):
+            if deadline is not None and time.monotonic() > deadline:
+                return order, best_cost
+            cost = get_path_cost(distance_matrix, penalties, candidate)
+            if cost < best_cost:
+                order, best_cost = candidate, cost
+                improved = True
+                break
+
+    return order, best_cost
+
+
+def perturb_gtsp_path(
+    order: List[int], groups: List[List[int]], rng: random.Random
+) -> List[int]:
+    """Random kick of an iterated local search: a double bridge (the path after node 0 cut into four segments A B C D
+    and reconnected as A C B D) on paths of four groups or more, and a random node reselection otherwise
+    """
+    tail = order[1:]
+    if len(tail) >= 4:
+        i, j, k = sorted(rng.sample(range(1, len(tail)), 3))
+        return [order[0]] + tail[:i] + tail[j:k] + tail[i:j] + tail[k:]
+
+    node_group = {node: g for g, nodes in enumerate(groups) for node in nodes}
+    i = rng.randrange(1, len(order))
+    order = list(order)
+    order[i] = rng.choice(list(groups[node_group[order[i]]]))
+    return order
+
+
+# Length of the slices of exact dynamic program and of local search alternating in `solve_gtsp_anytime`
+ANYTIME_SLICE_SECONDS = 0.005
+
+
+def solve_gtsp_anytime(
+    distance_matrix: np.ndarray,
+    groups: List[List[int]],
+    penalties: np.ndarray,
+    deadline: float,
+    seed: int = 0,
+) -> Tuple[List[int], float, bool]:
+    """Anytime generalized TSP: a local search path is found first and kept as the best path so far. Until the
+    deadline, slices of the exact dynamic program then alternate with rounds of an iterated local search, which kick
+    the best path with `perturb_gtsp_path` and improve the result, keeping it if it is cheaper. The dynamic program
+    keeps its table between slices, and its path is returned as soon as it completes.
+
+    If no feasible path is known at the deadline, the dynamic program is run to completion instead of giving up, so
+    that a path visiting every group is returned whenever one exists.
+
+    Args:
+        seed (int, optional): seed of the random kicks, so that the same inputs and timing give the same path
+
+    Returns:
+        Tuple[List[int], float, bool]: visiting order starting with node 0, its total cost, and whether it is proven optimal
+    """
+    order, distance = solve_gtsp_local_search(
+        distance_matrix, groups, penalties, deadline
+    )
+    # Nothing to decide without groups, and no path exists with an empty one
+    if not groups or any(len(nodes) == 0 for nodes in groups):
+        return order, distance, True
+
+    np_groups = [np.asarray(nodes, dtype=np.int64) for nodes in groups]
+    steps = _gtsp_dynamic_programming_steps(distance_matrix, np_groups, penalties)
+    rng = random.Random(seed)
+
+    try:
+        while time.monotonic() < deadline:
+            slice_end = min(deadline, time.monotonic() + ANYTIME_SLICE_SECONDS)
+            while time.monotonic() < slice_end:
+                next(steps)
+
+            if len(order) > 1:
+                candidate, cost = improve_gtsp_path(
+                    distance_matrix,
+                    groups,
+                    penalties,
+                    perturb_gtsp_path(order, groups, rng),
+                    min(deadline, time.monotonic() + ANYTIME_SLICE_SECONDS),
+                )
+                if cost < distance:
+                    order, distance = candidate, cost
+
+        if order:
+            return order, distance, False
+
+        # Nothing to return yet: finish the dynamic program past the deadline
+        while True:
+            next(steps)
+    except StopIteration as done:
+        exact_order, exact_distance = _gtsp_best_path(*done.value, np_groups)
+        return exact_order, exact_distance, True
+
+
+# Upper bound on the size of the DP table of one batch of `solve_tsp_dynamic_programming_batch`
+HELD_KARP_BATCH_BYTES = 64 * 1024 * 1024
+
+
+def solve_tsp_dynamic_programming_batch(
+    distance_matrices: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Held-Karp over a stack of (m, m) cost matrices, solving every matrix of a batch with the same vectorized subset
+    transitions. Like python_tsp's solve_tsp_dynamic_programming the tour starts at node 0 and returns to it, so an
+    open path is obtained by setting column 0 to 0.
+
+    Args:
+        distance_matrices (np.ndarray): (batch, m, m) edge costs
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (batch, m) permutations starting with node 0, and the (batch,) tour costs
+    """
+    batch, m, _ = distance_matrices.shape
+    k = m - 1
+    if k == 0:
+        return np.zeros((batch, 1), dtype=np.int64), np.zeros(batch)
+
+    # Split the stack so that the DP table stays within HELD_KARP_BATCH_BYTES
+    chunk = max(1, HELD_KARP_BATCH_BYTES // ((1 << k) * k * 8))
+    if batch > chunk:
+        results = [
+            solve_tsp_dynamic_programming_batch(distance_matrices[i : i + chunk])
+            for i in range(0, batch, chunk)
+        ]
+        return (
+            np.concatenate([permutations for permutations, _ in results]),
+            np.concatenate([distances for _, distances in results]),
+        )
+
+    rows = np.arange(batch)
+    # Costs between the nodes other than the start, node i + 1 is bit i of a subset
+    inner = distance_matrices[:, 1:, 1:]
+
+    # dp[b, S, j]: cheapest path of matrix b from node 0 through the nodes in S, ending at node j + 1
+    dp = np.full((batch, 1 << k, k), np.inf)
+    nodes = np.arange(k)
+    dp[:, 1 << nodes, nodes] = distance_matrices[:, 0, 1:]
+
+    # Subsets are processed in increasing order, so every subset is final before its supersets use it
+    for subset in range(1, 1 << k):
+        members = np.flatnonzero((subset >> nodes) & 1)
+        if members.size < 2:
+            continue
+        prev = subset ^ (1 << members)
+        # [b, t, i]: reach node members[t] + 1 from node i + 1 having visited prev[t]
+        candidates = dp[:, prev, :] + inner[:, :, members].transpose(0, 2, 1)
+        dp[:, subset, members] = candidates.min(axis=2)
+
+    full = (1 << k) - 1
+    final = dp[:, full, :] + distance_matrices[:, 1:, 0]
+    last = final.argmin(axis=1)
+    distances = final[rows, last]
+
+    # Backtrack from the last node of every tour at once
+    permutations = np.zeros((batch, m), dtype=np.int64)
+    subset = np.full(batch, full)
+    cur = last
+    for position in range(k, 0, -1):
+        permutations[:, position] = cur + 1
+        prev = subset ^ (1 << cur)
+        if position > 1:
+            cur = (dp[rows, prev, :] + inner[rows, :, cur]).argmin(axis=1)
+        subset = prev
+
+    return permutations, distances
+
+
+def get_path_lower_bounds(
+    distance_matrix: np.ndarray, subsets: np.ndarray
+) -> np.ndarray:
+    """Admissible lower bounds on the cost of an open path from the first node of each subset through all of its nodes:
+    the larger of the minimum spanning tree weight and the sum of the cheapest edge into every other node.
+
+    Args:
+        distance_matrix (np.ndarray): (n, n) edge costs of all nodes, symmetric apart from column 0 which only holds the free return to the start
+        subsets (np.ndarray): (count, m) node indices of each subset, all starting with the same start node
+
+    Returns:
+        np.ndarray: (count,) lower bounds
+    """
+    count, m = subsets.shape
+    if m < 2:
+        return np.zeros(count)
+
+    costs = distance_matrix[subsets[:, :, None], subsets[:, None, :]]
+    # A path never returns to the start, so use the cost of leaving it for both directions
+    costs[:, :, 0] = costs[:, 0, :]
+    costs[:, np.arange(m), np.arange(m)] = np.inf
+
+    # Every node but the start is entered exactly once
+    nearest = costs[:, :, 1:].min(axis=1).sum(axis=1)
+
+    # A path is a spanning tree, so it weighs at least as much as the minimum one (Prim's algorithm on every subset)
+    rows = np.arange(count)
+    in_tree = np.zeros((count, m), dtype=bool)
+    in_tree[:, 0] = True
+    connect = costs[:, 0, :].copy()
+    tree = np.zeros(count)
+    for _ in range(m - 1):
+        candidates = np.where(in_tree, np.inf, connect)
+        node = candidates.argmin(axis=1)
+        tree += candidates[rows, node]
+        in_tree[rows, node] = True
+        connect = np.minimum(connect, costs[rows, node, :])
+
+    return np.maximum(tree, nearest)
+
+
+def solve_tsp_subsets(
+    distance_matrix: np.ndarray,
+    subsets: np.ndarray,
+    fixed_costs: np.ndarray,
+    batch_size: int,
+    deadline: Optional[float] = None,
+    max_cost: float = 1e9,
+) -> Tuple[int, float, List[int], bool, int]:
+    """Solve the TSP of every subset of nodes of one distance matrix, `batch_size` subsets per Held-Karp call, and
+    keep the first subset with the lowest tour cost plus fixed cost. Tours using an edge of cost `max_cost` or more,
+    and totals of `max_cost` or more, are infeasible.
+
+    Subsets are solved in increasing order of their lower bound (see `get_path_lower_bounds`), and skipped without a
+    solver call once their bound shows they cannot beat the best subset found so far.
+
+    Args:
+        distance_matrix (np.ndarray): (n, n) edge costs of all nodes
+        subsets (np.ndarray): (count, m) node indices of each subset, all starting with the same start node
+        fixed_costs (np.ndarray): (count,) cost added to the tour cost of each subset
+        batch_size (int): maximum number of subsets per batched Held-Karp call
+        deadline (float, optional): time.monotonic() value after which no more batches are solved, once a feasible
+            subset is found
+
+    Returns:
+        Tuple[int, float, List[int], bool, int]: index of the best subset (-1 if none is feasible), its total cost, its
+            tour as indices into distance_matrix, whether every subset was solved or pruned before the deadline, and the
+            number of pruned subsets
+    """
+    best_index, best_cost, best_order = -1, max_cost, []
+    pruned = 0
+
+    lower_bounds = fixed_costs + get_path_lower_bounds(distance_matrix, subsets)
+    # Stable sort, so that subsets with equal bounds keep their order
+    queue = np.argsort(lower_bounds, kind="stable")
+
+    # Batches start small, so that an incumbent is found before most subsets are solved, and grow up to batch_size
+    start, size = 0, 1
+    while start < len(queue):
+        # Subsets are solved past the deadline until one is feasible, so that a path is found whenever one exists
+        if best_index != -1 and deadline is not None and time.monotonic() > deadline:
+            return best_index, best_cost, best_order, False, pruned
+
+        candidates = queue[start : start + size]
+        start += len(candidates)
+        size = min(size * 2, batch_size)
+        bounds = lower_bounds[candidates]
+        # Ties with the best subset only matter for subsets that come first in the original order
+        keep = (bounds < best_cost) | ((bounds == best_cost) & (candidates < best_index))
+        pruned += int((~keep).sum())
+        if bounds[0] > best_cost:
+            # Every later subset has an even higher bound
+            pruned += len(queue) - start
+            break
+        candidates = candidates[keep]
+        if candidates.size == 0:
+            continue
+
+        batch = subsets[candidates]
+        permutations, distances = solve_tsp_dynamic_programming_batch(
+            distance_matrix[batch[:, :, None], batch[:, None, :]]
+        )
+        totals = distances + fixed_costs[candidates]
+
+        # Skip subsets where some leg of the tour has no path, and keep the first best one
+        improves = (distances < max_cost) & (
+            (totals < best_cost) | ((totals == best_cost) & (candidates < best_index))
+        )
+        if not improves.any():
+            continue
+
+        improving = np.flatnonzero(improves)
+        best = improving[np.lexsort((candidates[improving], totals[improving]))[0]]
+        best_index = int(candidates[best])
+        best_cost = float(totals[best])
+        best_order = batch[best][permutations[best]].tolist()
+
+    return best_index, best_cost, best_order, True, pruned
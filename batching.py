@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from metrics import INFERENCE_BATCH_SECONDS, INFERENCE_BATCH_SIZES
+
+
+class MicroBatcher:
+    """Collects items submitted by concurrent requests into batches and runs one batched call per batch
+
+    The first item of a batch waits at most `window_ms` for other items to join, and a batch is started early once it
+    has `max_batch_size` items. A single background thread runs the batches, so the batch function is never called
+    concurrently.
+    """
+
+    def __init__(self, batch_fn, window_ms: float = 10, max_batch_size: int = 8, name="yolo"):
+        """
+        Args:
+            batch_fn (Callable[[list], list]): takes a list of items and returns the list of their results, in order
+            window_ms (float, optional): longest time to wait for a batch to fill up. Defaults to 10.
+            max_batch_size (int, optional): largest number of items in a batch. Defaults to 8.
+            name (str, optional): label of the batch size histogram. Defaults to "yolo".
+        """
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.name = name
+        # (item, future, time.perf_counter() of submission)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        """Queue an item for the next batch, starting the batching thread on first use
+
+        Returns:
+            Future: resolves to the item's result, or to the exception raised by the batch function
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item):
+        """Run an item in the next batch and wait for its result"""
+        return self.submit(item).result()
+
+    def _collect(self) -> list:
+        """Block until an item arrives, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        closes = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = closes - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            for _, _, submitted in batch:
+                INFERENCE_BATCH_SECONDS.observe("wait", start - submitted)
+            INFERENCE_BATCH_SIZES.observe(self.name, len(batch))
+
+            try:
+                results = self.batch_fn([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                INFERENCE_BATCH_SECONDS.observe("forward", time.perf_counter() - start)
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
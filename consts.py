@@ -35,3 +35,27 @@ TURN_RADIUS = 1
 SAFE_COST = 2000 # the cost for the turn in case there is a chance that the robot is touch some obstacle
 SCREENSHOT_COST = 50 # the cost for the place where the picture is taken
 
+EDGE_CACHE_SIZE = 20000 # max number of A* edges kept in the process-wide edge cache
+SOLUTION_CACHE_SIZE = 256 # max number of /path solutions kept in memory
+SOLUTION_CACHE_PATH = None # SQLite file keeping /path solutions across restarts, None to keep them in memory only
+
+PLANNING_WORKERS = 2 # worker processes solving /path requests
+PLANNING_QUEUE_SIZE = 4 # /path requests waiting for a planning worker before new ones get a 503
+INFERENCE_WORKERS = 4 # threads handling /image requests, at least INFERENCE_BATCH_SIZE for batches to fill up
+INFERENCE_QUEUE_SIZE = 8 # /image requests waiting for an inference thread before new ones get a 503
+INFERENCE_BATCH_WINDOW_MS = 10 # longest wait for concurrent /image requests to join an inference batch, 0 to run one image per call
+INFERENCE_BATCH_SIZE = 4 # max number of images in one batched forward pass
+IMAGE_WRITER_QUEUE_SIZE = 16 # /image results waiting to be annotated and saved in the background
+ANNOTATE_IMAGES = True # draw the detections onto the saved /image results, False to save the uploaded files as they are
+ROI_COLUMNS = {"L": (0.0, 0.6), "C": (0.2, 0.8), "R": (0.4, 1.0)} # horizontal span of the frame searched for each SNAP hint, as fractions of the width
+ROI_IMAGE_SIZE = 320 # inference size of the region of interest, a multiple of 32 below the model's 640
+ROI_FAR_IMAGE_SIZE = 480 # inference size of the region of interest when the obstacle is further than ROI_FAR_DISTANCE
+ROI_FAR_DISTANCE = 3 # grid cells between the robot and the obstacle above which its symbol needs more pixels
+STITCH_TILE_WIDTH = 320 # width in pixels of the view of one obstacle in the /stitch mosaic
+STITCH_TILE_HEIGHT = 240 # height in pixels of the view of one obstacle in the /stitch mosaic
+STITCH_COLUMNS = 4 # obstacles per row of the /stitch mosaic
+STITCH_MAX_TILES = 8 # obstacles held by the /stitch mosaic, which is allocated once at this size
+STITCH_OUTPUT_DIR = "runs/stitched" # directory the /stitch mosaics are saved to, ignored by git
+DETECTION_CACHE_SIZE = 64 # /image frames whose detections are kept, to answer re-uploads without inference
+DETECTION_CACHE_TTL = 60 # seconds after which a frame uploaded again is detected again
+DETECTION_CACHE_MAX_DISTANCE = None # differing bits of the perceptual hashes of two frames to treat them as the same, None to only match identical files
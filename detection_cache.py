@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class DetectionCache:
+    """Thread-safe cache of /image detections, so that a frame uploaded again is answered without inference
+
+    Frames are looked up by the hash of their bytes, and optionally by a perceptual hash of the decoded frame, which
+    also matches re-encoded or near-identical frames. The least recently used entry is evicted beyond `maxsize`
+    entries, and entries expire `ttl` seconds after they were stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_distance: int = None):
+        """
+        Args:
+            maxsize (int): Maximum number of frames kept
+            ttl (float): Seconds after which a frame is detected again
+            max_distance (int, optional): Largest number of differing bits between the perceptual hashes of two frames
+                for them to be considered the same. Defaults to None, to only match identical bytes.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        # key: hash of the frame's bytes, value: (time.monotonic() of expiry, perceptual hash or None, detections)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def perceptual(self) -> bool:
+        return self.max_distance is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(file_data: bytes) -> str:
+        return hashlib.blake2b(file_data, digest_size=16).hexdigest()
+
+    def get(self, key: str):
+        """Look up a frame by the hash of its bytes
+
+        Returns:
+            Any: cached detections, or None on a miss. Misses are only counted by `get_similar`, if the cache is
+                perceptual
+        """
+        with self._lock:
+            self._expire()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][2]
+            if not self.perceptual:
+                self.misses += 1
+            return None
+
+    def get_similar(self, perceptual_hash: int, key: str = None):
+        """Look up the frame with the closest perceptual hash, within `max_distance` bits
+
+        Args:
+            perceptual_hash (int): perceptual hash of the decoded frame
+            key (str, optional): hash of the frame's bytes. On a hit, the detections are also stored under it, until
+                the matched frame expires, so that the same bytes uploaded again are found by `get` without decoding
+
+        Returns:
+            Any: cached detections, or None on a miss
+        """
+        with self._lock:
+            self._expire()
+            best_key, best_distance = None, self.max_distance + 1
+            for other_key, (_, other_hash, _) in self._entries.items():
+                if other_hash is None:
+                    continue
+                distance = bin(perceptual_hash ^ other_hash).count("1")
+                if distance < best_distance:
+                    best_key, best_distance = other_key, distance
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.perceptual_hits += 1
+            expiry, _, value = self._entries[best_key]
+            if key is not None and key not in self._entries:
+                # Without a perceptual hash, as the matched frame already stands for this one in `get_similar`
+                self._entries[key] = (expiry, None, value)
+                self._evict()
+            return value
+
+    def put(self, key: str, value, perceptual_hash: int = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, perceptual_hash, value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.perceptual_hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self):
+        """Drop the least recently used entries beyond `maxsize`. Called with the lock held"""
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _expire(self):
+        """Drop the expired entries. Called with the lock held"""
+        now = time.monotonic()
+        expired = [key for key, (expiry, _, _) in self._entries.items() if expiry <= now]
+        for key in expired:
+            del self._entries[key]
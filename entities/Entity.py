@@ -1,5 +1,6 @@
 from typing import List
-from consts import Direction, EXPANDED_CELL, SCREENSHOT_COST
+import numpy as np
+from consts import Direction, EXPANDED_CELL, SCREENSHOT_COST, SAFE_COST
 from consts import WIDTH, HEIGHT, Direction
 
 
@@ -12,6 +13,9 @@ def is_valid_cell(center_x: int, center_y: int):
 class CellState:
     """Base class for all objects on the arena, such as cells, obstacles, etc"""
 
+    # Paths hold one cell state per step, so the per-instance dict is left out
+    __slots__ = ("x", "y", "direction", "screenshot_id", "penalty")
+
     def __init__(
         self,
         x: int,
@@ -40,6 +44,20 @@ class CellState:
         return self.x == x and self.y == y and self.direction == direction
 
 
+    def __eq__(self, other):
+        """Cell states are compared by value, so that they can be used as keys of the cost and path tables"""
+        if not isinstance(other, CellState):
+            return NotImplemented
+        return (
+            self.x == other.x
+            and self.y == other.y
+            and self.direction == other.direction
+            and self.screenshot_id == other.screenshot_id
+        )
+
+    def __hash__(self):
+        return hash((self.x, self.y, self.direction, self.screenshot_id))
+
     def __repr__(self):
         return "Cell(x: {}, y: {}, d: {}, screenshot_id: {})".format(
             self.x, self.y, self.direction, self.screenshot_id
@@ -57,6 +75,8 @@ class CellState:
 class Obstacle(CellState):
     """Obstacle class, inherited from CellState"""
 
+    __slots__ = ("obstacle_id",)
+
     def __init__(self, x: int, y: int, direction: Direction, obstacle_id: int):
         super().__init__(x, y, direction)
         self.obstacle_id = obstacle_id
@@ -134,6 +154,9 @@ class Grid:
         self.size_x = size_x
         self.size_y = size_y
         self.obstacles: List[Obstacle] = []
+        # Dense lookup maps, built lazily once per obstacle set (see `_build_maps`)
+        self._reachable_maps = None
+        self._safe_cost_map = None
 
     def add_obstacle(self, obstacle: Obstacle):
         """Add a new obstacle to the Grid object, ignores if duplicate obstacle
@@ -150,9 +173,63 @@ class Grid:
 
         if to_add:
             self.obstacles.append(obstacle)
+            self._invalidate_maps()
+
+    def remove_obstacle(self, obstacle_id: int):
+        """Remove the obstacles with the given id from the Grid object
+
+        Args:
+            obstacle_id (int): ID of the obstacle to be removed
+        """
+        self.obstacles = [ob for ob in self.obstacles if ob.obstacle_id != obstacle_id]
+        self._invalidate_maps()
 
     def reset_obstacles(self):
         self.obstacles = []
+        self._invalidate_maps()
+
+    def _invalidate_maps(self):
+        self._reachable_maps = None
+        self._safe_cost_map = None
+
+    def _build_maps(self):
+        """Precompute the reachability maps (plain, turn, preTurn) and the safe cost map for the current obstacles.
+
+        Each map is indexed by [x, y] and mirrors exactly the per-obstacle rules of `reachable` and `get_safe_cost`.
+        """
+        xs, ys = np.meshgrid(
+            np.arange(self.size_x), np.arange(self.size_y), indexing="ij"
+        )
+        valid = (xs > 0) & (ys > 0) & (xs < self.size_x - 1) & (ys < self.size_y - 1)
+        blocked = np.zeros((self.size_x, self.size_y), dtype=bool)
+        blocked_turn = np.zeros((self.size_x, self.size_y), dtype=bool)
+        safe_cost = np.zeros((self.size_x, self.size_y), dtype=np.int64)
+
+        for ob in self.obstacles:
+            dx = np.abs(ob.x - xs)
+            dy = np.abs(ob.y - ys)
+            chebyshev = np.maximum(dx, dy)
+
+            # Must be at least 4 units away in total (x+y), unless the four bypass applies
+            near = dx + dy < 4
+            if ob.x == 4 and ob.y <= 4:
+                near &= ~((xs < 4) & (ys < 4))
+
+            blocked |= near & (chebyshev < 2)
+            blocked_turn |= near & (chebyshev < EXPANDED_CELL * 2 + 1)
+
+            safe_cost[
+                ((dx == 2) & (dy == 2)) | ((dx == 1) & (dy == 2)) | ((dx == 2) & (dy == 1))
+            ] = SAFE_COST
+
+        reachable_turn = valid & ~blocked_turn
+        self._reachable_maps = {
+            (False, False): valid & ~blocked,
+            (True, False): reachable_turn,
+            (False, True): reachable_turn,
+            (True, True): reachable_turn,
+        }
+        self._safe_cost_map = safe_cost
 
     def reachable(self, x: int, y: int, turn=False, preTurn=False) -> bool:
         """Checks whether the given x,y coordinate is reachable/safe. Criterion is as such:
@@ -170,35 +247,51 @@ class Grid:
         if not self.is_valid_coord(x, y):
             return False
 
-        for ob in self.obstacles:
-            # print(f"Looking at position x:{x} y:{y} against ob: {ob.x} {ob.y}")
-            if ob.x == 4 and ob.y <= 4 and x < 4 and y < 4:
-                # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered four bypass")
-                continue
+        if self._reachable_maps is None:
+            self._build_maps()
 
-            # Must be at least 4 units away in total (x+y)
-            if abs(ob.x - x) + abs(ob.y - y) >= 4:
-                # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered more than 3 units bypass")
-                continue
+        return bool(self._reachable_maps[(bool(turn), bool(preTurn))][x, y])
+
+    def get_reachable_map(self, turn=False, preTurn=False) -> np.ndarray:
+        """Returns the boolean [x, y] map of `reachable` over the whole arena"""
+        if self._reachable_maps is None:
+            self._build_maps()
+
+        return self._reachable_maps[(bool(turn), bool(preTurn))]
+
+    def get_safe_cost_map(self) -> np.ndarray:
+        """Returns the [x, y] map of `get_safe_cost` over the whole arena"""
+        if self._safe_cost_map is None:
+            self._build_maps()
+
+        return self._safe_cost_map
 
-            # If max(x,y) is less than 3 units away, consider not reachable
-            if turn and max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
-                # if ob.x == 0 and ob.y == 10 and x == 1 and y == 12:
-                #     print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered less than 3 max units trap")
-                return False
-            if preTurn and max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
-                # if ob.x == 0 and ob.y == 10 and x == 1 and y == 12:
-                #     print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered less than 3 max units trap")
-                return False
-            elif max(abs(ob.x - x), abs(ob.y - y)) < 2:
-                # print(f"ob.x: {ob.x} ob.y: {ob.y} x: {x} y:{y} Triggered less than 3 max units trap")
-                return False
-
-        return True
+    def get_safe_cost(self, x: int, y: int) -> int:
+        """Get the safe cost of a particular x,y coordinate, i.e. SAFE_COST if any obstacle is at (2,2), (1,2) or (2,1) units away from it, 0 otherwise
+
+        Args:
+            x (int): x-coordinate, must lie inside the arena
+            y (int): y-coordinate, must lie inside the arena
+
+        Returns:
+            int: safe cost
+        """
+        if self._safe_cost_map is None:
+            self._build_maps()
+
+        return int(self._safe_cost_map[x, y])
 
     def is_valid_coord(self, x: int, y: int) -> bool:
         return x > 0 and y > 0 and x < self.size_x - 1 and y < self.size_y - 1
 
+    def get_layout_key(self) -> tuple:
+        """Returns a hashable key of the obstacle layout. Only the obstacle positions affect reachability, so directions and ids are left out"""
+        return (
+            self.size_x,
+            self.size_y,
+            tuple(sorted({(ob.x, ob.y) for ob in self.obstacles})),
+        )
+
     def get_view_obstacle_positions(self, retrying) -> List[List[CellState]]:
         """
         This function return a list of desired states for the robot to achieve based on the obstacle position and direction.
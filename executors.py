@@ -0,0 +1,132 @@
+import multiprocessing
+import threading
+from concurrent.futures import (
+    BrokenExecutor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from consts import (
+    PLANNING_WORKERS,
+    PLANNING_QUEUE_SIZE,
+    INFERENCE_WORKERS,
+    INFERENCE_QUEUE_SIZE,
+)
+
+
+class ExecutorBusyError(Exception):
+    """Raised when a job is submitted to a BoundedExecutor whose queue is full"""
+
+
+class BoundedExecutor:
+    """Executor that accepts at most `workers + queue_size` jobs at a time and rejects the others right away, so that
+    the server answers with 503 instead of queueing requests without bound. The underlying executor is created on the
+    first submit, and created again when it is broken, e.g. by a worker process that died.
+    """
+
+    def __init__(self, executor_class, workers: int, queue_size: int, **executor_kwargs):
+        """
+        Args:
+            executor_class (type): ProcessPoolExecutor or ThreadPoolExecutor
+            workers (int): number of jobs running at the same time
+            queue_size (int): number of jobs waiting for a worker
+            executor_kwargs: passed on to executor_class, such as the mp_context of a ProcessPoolExecutor
+        """
+        self.executor_class = executor_class
+        self.executor_kwargs = executor_kwargs
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rejected = 0
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+
+    def configure(self, workers: int = None, queue_size: int = None):
+        """Change the number of workers and the queue size. Only allowed before the first job is submitted"""
+        with self._lock:
+            if self._executor is not None:
+                raise RuntimeError("The executor is already running")
+            if workers is not None:
+                self.workers = workers
+            if queue_size is not None:
+                self.queue_size = queue_size
+            self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Schedule fn(*args, **kwargs)
+
+        Raises:
+            ExecutorBusyError: if every worker is busy and the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusyError(
+                f"{self.workers} workers busy and {self.queue_size} jobs queued"
+            )
+
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args, **kwargs)
+            except BrokenExecutor:
+                # A worker died and broke the pool, so the job goes to a new one
+                self._discard(executor)
+                future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Submit fn(*args, **kwargs) and wait for its result. A job whose worker died is retried once, in a new pool
+
+        Raises:
+            ExecutorBusyError: if every worker is busy and the queue is full
+        """
+        try:
+            return self.submit(fn, *args, **kwargs).result()
+        except BrokenExecutor:
+            # The broken pool is replaced by the next submit
+            return self.submit(fn, *args, **kwargs).result()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self.executor_class(
+                    max_workers=self.workers, **self.executor_kwargs
+                )
+            return self._executor
+
+    def _discard(self, executor):
+        """Drop a broken executor, so that the next job creates a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+# CPU-bound path planning runs in its own processes, so that it neither holds the GIL of the request threads nor
+# delays inference. The pool is created by the first request, when the server already runs threads, so its processes
+# are started by a forkserver (or spawned where there is none) instead of forking the multithreaded server
+planning_executor = BoundedExecutor(
+    ProcessPoolExecutor,
+    PLANNING_WORKERS,
+    PLANNING_QUEUE_SIZE,
+    mp_context=multiprocessing.get_context(
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    ),
+)
+# Inference runs in threads of the server process, where the model is loaded
+inference_executor = BoundedExecutor(
+    ThreadPoolExecutor, INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE
+)
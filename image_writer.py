@@ -0,0 +1,105 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from metrics import IMAGE_STAGE_SECONDS
+
+
+class ImageWriter:
+    """Saves the /image results in a background thread, so that requests answer as soon as the detections are ready
+
+    The queue holds at most `maxsize` images. When it is full, the image is dropped and counted in `rejected`, so that
+    memory stays bounded and no disk I/O falls back on the request thread. The annotation, write and mosaic times go
+    to the /image stage histogram.
+    """
+
+    def __init__(self, directory: str, maxsize: int, annotate: bool = True, mosaic=None):
+        """
+        Args:
+            directory (str): folder the images are saved to
+            maxsize (int): number of images waiting to be saved
+            annotate (bool, optional): draw the detections onto the images. Defaults to True. If False, the bytes of
+                the uploaded file are saved as they are, without decoding or encoding
+            mosaic (Mosaic, optional): receives every image once it is annotated, for /stitch
+        """
+        self.directory = directory
+        self.annotate = annotate
+        self.mosaic = mosaic
+        # Number of images dropped because the queue was full, served by /metrics
+        self.rejected = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(
+        self, filename: str, file_data: bytes, image_instance, response_obj: dict, obstacle_id=None
+    ):
+        """Queue an image to be saved, or drop it if the queue is full
+
+        Args:
+            filename (str): name of the uploaded file
+            file_data (bytes): the uploaded file
+            image_instance (np.ndarray): the decoded image, which is drawn on in place
+            response_obj (dict): detections returned by rec_img
+            obstacle_id (optional): obstacle in view, see Mosaic.add
+        """
+        job = (filename, file_data, image_instance, response_obj, obstacle_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            # Saving is best effort: the /image response does not wait for the disk when the writer falls behind
+            print(f"Dropped {filename}: the image writer queue is full")
+
+    def write(
+        self, filename: str, file_data: bytes, image_instance, response_obj: dict, obstacle_id=None
+    ):
+        """Annotate and save one image, and add it to the mosaic"""
+        path = os.path.join(self.directory, filename)
+        if not self.annotate:
+            start = time.perf_counter()
+            with open(path, "wb") as f:
+                f.write(file_data)
+            IMAGE_STAGE_SECONDS.observe("write", time.perf_counter() - start)
+            self.add_to_mosaic(obstacle_id, image_instance, response_obj)
+            return
+
+        import cv2
+        import model as ModelModule
+
+        start = time.perf_counter()
+        ModelModule.annotate_image(image_instance, response_obj)
+        IMAGE_STAGE_SECONDS.observe("annotation", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        cv2.imwrite(filename=path, img=image_instance)
+        IMAGE_STAGE_SECONDS.observe("write", time.perf_counter() - start)
+        self.add_to_mosaic(obstacle_id, image_instance, response_obj)
+
+    def add_to_mosaic(self, obstacle_id, image_instance, response_obj: dict):
+        if self.mosaic is None:
+            return
+        start = time.perf_counter()
+        self.mosaic.add(obstacle_id, image_instance, response_obj)
+        IMAGE_STAGE_SECONDS.observe("mosaic", time.perf_counter() - start)
+
+    def flush(self):
+        """Wait until every queued image is saved"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self.write(*job)
+            except Exception as e:
+                print(f"Failed to save {job[0]}: {e}")
+            finally:
+                self._queue.task_done()
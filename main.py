@@ -1,18 +1,119 @@
+import argparse
+import os
+import threading
 import time
-from algo.algo import MazeSolver
-from algo.helper import command_generator
-from flask import Flask, request, jsonify
-from consts import Direction, WIDTH, HEIGHT
+from algo.cache import edge_cache, solution_cache
+from algo.planner import plan_path
+from batching import MicroBatcher
+from detection_cache import DetectionCache
+from executors import ExecutorBusyError, inference_executor, planning_executor
+from image_writer import ImageWriter
+from mosaic import Mosaic
+from flask import Flask, Response, request, jsonify
+from consts import (
+    Direction,
+    INFERENCE_BATCH_WINDOW_MS,
+    INFERENCE_BATCH_SIZE,
+    IMAGE_WRITER_QUEUE_SIZE,
+    ANNOTATE_IMAGES,
+    ROI_COLUMNS,
+    STITCH_TILE_WIDTH,
+    STITCH_TILE_HEIGHT,
+    STITCH_COLUMNS,
+    STITCH_MAX_TILES,
+    STITCH_OUTPUT_DIR,
+    DETECTION_CACHE_SIZE,
+    DETECTION_CACHE_TTL,
+    DETECTION_CACHE_MAX_DISTANCE,
+)
+from metrics import (
+    IMAGE_STAGE_SECONDS,
+    PATH_STAGE_SECONDS,
+    StageTimer,
+    render_metrics,
+)
 
 # from flask_cors import CORS
-import model as ModelModule
 from typing import Any
-import cv2
+
+# The model module pulls in torch, ultralytics and cv2, so it is only imported by the endpoints that need it
 
 app = Flask(__name__)
 
-# model = ModelModule.load_model('Week_8.pt')
-model = ModelModule.YoloV8("best_v8.pt")
+# Set by --planner-only, to serve /path without ever importing the model
+planner_only = False
+model = None
+model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Load the model on first use, so that the server starts without waiting for torch and the weights
+    :return: the YOLO model
+    """
+    global model
+    with model_lock:
+        if model is None:
+            import model as ModelModule
+
+            # model = ModelModule.load_model('Week_8.pt')
+            model = ModelModule.YoloV8("best_v8.pt")
+    return model
+
+
+def make_inference_batcher(window_ms: float, max_batch_size: int):
+    """
+    Batch the inference of concurrent /image requests into single forward passes
+    :return: a MicroBatcher, or None to run one image per forward pass if window_ms is 0. The forward passes then run
+        one at a time, see ModelModule.predict_batch
+    """
+    if window_ms <= 0:
+        return None
+
+    def run_batch(items):
+        import model as ModelModule
+
+        return ModelModule.predict_batch(get_model(), items)
+
+    return MicroBatcher(run_batch, window_ms, max_batch_size)
+
+
+inference_batcher = make_inference_batcher(
+    INFERENCE_BATCH_WINDOW_MS, INFERENCE_BATCH_SIZE
+)
+# Detections of the recent /image frames, for the retries uploading the same frame again
+detection_cache = DetectionCache(
+    DETECTION_CACHE_SIZE, DETECTION_CACHE_TTL, DETECTION_CACHE_MAX_DISTANCE
+)
+# Best view of each obstacle, served by /stitch
+mosaic = Mosaic(STITCH_TILE_WIDTH, STITCH_TILE_HEIGHT, STITCH_COLUMNS, STITCH_MAX_TILES)
+# Annotates and saves the /image results after the response is sent, and adds them to the mosaic
+image_writer = ImageWriter(
+    "tests/result", IMAGE_WRITER_QUEUE_SIZE, ANNOTATE_IMAGES, mosaic=mosaic
+)
+
+
+def planner_only_response():
+    """
+    Response to an image request in planner-only mode
+    :return: a json object with a key "error", with the status code 503
+    """
+    response = jsonify(
+        {"data": None, "error": "Image recognition is disabled in planner-only mode"}
+    )
+    response.status_code = 503
+    return response
+
+
+def busy_response(error: ExecutorBusyError):
+    """
+    Response to a request that was rejected because its executor's queue is full
+    :return: a json object with a key "error", with the status code 503
+    """
+    response = jsonify({"data": None, "error": f"Server busy: {error}"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
 
 
 @app.route("/status", methods=["GET"])
@@ -24,6 +125,29 @@ def status():
     return jsonify({"result": "ok"})
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Histograms of the time spent in each stage of the /path and /image requests
+    :return: the metrics in the Prometheus text format
+    """
+    return Response(
+        render_metrics(
+            caches={
+                "edge": edge_cache,
+                "solution": solution_cache,
+                "detection": detection_cache,
+            },
+            executors={
+                "planning": planning_executor,
+                "inference": inference_executor,
+                "image_writer": image_writer,
+            },
+        ),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
 @app.route("/path", methods=["POST"])
 def path_finding():
     """
@@ -39,45 +163,33 @@ def path_finding():
     retrying = content["retrying"]
     robot_x, robot_y = content["robot_x"], content["robot_y"]
     robot_direction = Direction(content["robot_dir"])
+    # Optional time budget for the solver; without it the search is exact
+    time_budget_ms = content.get("time_budget_ms")
+    # Whether to return the time spent in each stage
+    return_timings = content.get("timings", False)
 
-    # Initialize MazeSolver object with robot size of 20x20, bottom left corner of robot at (1,1), facing north, and whether to use a big turn or not.
-    maze_solver = MazeSolver(
-        WIDTH, HEIGHT, robot_x, robot_y, robot_direction, big_turn=0
-    )
-
-    # Add each obstacle into the MazeSolver. Each obstacle is defined by its x,y positions, its direction, and its id
-    for ob in obstacles:
-        maze_solver.add_obstacle(ob["x"], ob["y"], ob["d"], ob["id"])
-
-    start = time.time()
-    # Get shortest path
-    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=retrying)
-
-    print(f"Time taken to find shortest path using A* search: {time.time() - start}s")
-    print(f"Distance to travel: {distance} units")
-
-    # Based on the shortest path, generate commands for the robot
-    commands = command_generator(optimal_path, obstacles)
-
-    # Get the starting location and add it to path_results
-    path_results = [optimal_path[0].get_dict()]
-    # Process each command individually and append the location the robot should be after executing that command to path_results
-    i = 0
-    for command in commands:
-        if command.startswith("SNAP") or command.startswith("SSSSS"):
-            continue
-        elif command.startswith("FW") or command.startswith("BW"):
-            compressed = int(command[-3:]) // 10
-            i += compressed
-        else:
-            i += 1
-        path_results.append(optimal_path[i].get_dict())
-    return jsonify(
-        {
-            "data": {"distance": distance, "path": path_results, "commands": commands},
-            "error": None,
-        }
-    )
+    timer = StageTimer(PATH_STAGE_SECONDS)
+    deadline = None
+    if time_budget_ms is not None:
+        deadline = time.monotonic() + time_budget_ms / 1000
+    # Get the shortest path and the commands, from the solution cache if the layout was solved before
+    try:
+        data = plan_path(
+            obstacles,
+            robot_x,
+            robot_y,
+            robot_direction,
+            retrying,
+            big_turn=0,
+            deadline=deadline,
+            timer=timer,
+            executor=planning_executor,
+        )
+    except ExecutorBusyError as e:
+        return busy_response(e)
+    if return_timings:
+        data["timings"] = timer.timings
+    return jsonify({"data": data, "error": None})
 
 
 @app.route("/image", methods=["POST"])
@@ -86,19 +198,62 @@ def image_predict():
     This is the main endpoint for the image prediction algorithm
     :return: a json object with a key "result" and value a dictionary with keys "obstacle_id" and "image_id"
     """
+    if planner_only:
+        return planner_only_response()
+    import model as ModelModule
+
     # Get the file from the request
     image_file = request.files["file"]
 
     # Get the file name
     filename = image_file.filename
 
+    # Whether to return the time spent in each stage, as a query or form field
+    return_timings = request.values.get("timings", "").lower() in ("1", "true")
+
+    # Optional position of the obstacle in the frame, as "L", "R" or "C" or as the SNAP command itself (e.g. "SNAP3_L").
+    # Unknown hints are ignored and the full frame is searched
+    hint = request.values.get("hint", "").rsplit("_", 1)[-1].upper()
+    if hint not in ROI_COLUMNS:
+        hint = None
+    # Optional number of grid cells between the robot and the obstacle
+    distance = request.values.get("distance", type=float)
+    # Obstacle in view, for the /stitch mosaic: an "obstacle_id" field, or the obstacle_id of a
+    # "<timestamp>_<obstacle_id>_<signal>.jpeg" filename. Without either, the mosaic goes by the detected symbol
+    obstacle_id = request.values.get("obstacle_id")
+    constituents = filename.split("_")
+    if obstacle_id is None and len(constituents) == 3:
+        obstacle_id = constituents[1]
+
     # Read the bytes data from the file
     file_data: bytes = image_file.read()
 
-    (image_id, response_obj, image_instance) = ModelModule.rec_img(model, file_data)
+    timer = StageTimer(IMAGE_STAGE_SECONDS)
+    stage_seconds = {}
+    try:
+        future = inference_executor.submit(
+            ModelModule.rec_img,
+            get_model(),
+            file_data,
+            timings=stage_seconds,
+            infer=inference_batcher,
+            hint=hint,
+            distance=distance,
+            cache=detection_cache,
+        )
+    except ExecutorBusyError as e:
+        return busy_response(e)
+    (image_id, response_obj, image_instance, cached) = future.result()
+    # Cache lookup, decode, region of interest and full frame inference, as timed by the model
+    for stage, seconds in stage_seconds.items():
+        timer.record(stage, seconds)
 
-    # Write the image
-    cv2.imwrite(filename=f"tests/result/{filename}", img=image_instance)
+    # Annotate and write the image in the background. A cached frame was already saved when it was first detected
+    if not cached:
+        with timer.stage("queue"):
+            image_writer.submit(
+                filename, file_data, image_instance, response_obj, obstacle_id=obstacle_id
+            )
 
     # filename format: "<timestamp>_<obstacle_id>_<signal>.jpeg"
     # constituents = file.filename.split("_")
@@ -118,21 +273,94 @@ def image_predict():
     #     "image_id": image_id
     # }
 
-    return jsonify({"image_id": image_id, "detected": response_obj})
+    result = {"image_id": image_id, "detected": response_obj, "cached": cached}
+    if return_timings:
+        result["timings"] = timer.timings
+    return jsonify(result)
 
 
 @app.route("/stitch", methods=["GET"])
 def stitch():
     """
-    This is the main endpoint for the stitching command. Stitches the images using two different functions,
-    in effect creating two stitches, just for redundancy purposes
+    This is the main endpoint for the stitching command. The mosaic of the best view of each obstacle is kept up to
+    date as the images arrive, so it is saved to STITCH_OUTPUT_DIR right away
+    :return: a json object with keys "result", "obstacles" and "path", or the mosaic as a JPEG image with format=jpeg
     """
-    # img = ModelModule.stitch_image()
-    # img.show()
-    img2 = ModelModule.stitch_image_own()
-    img2.show()
-    return jsonify({"result": "ok"})
+    if planner_only:
+        return planner_only_response()
+    import cv2
+
+    # The images still queued in the writer are added to the mosaic first
+    image_writer.flush()
+    stitched = mosaic.image()
+    if request.args.get("format") == "jpeg":
+        return Response(cv2.imencode(".jpg", stitched)[1].tobytes(), mimetype="image/jpeg")
+
+    os.makedirs(STITCH_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(STITCH_OUTPUT_DIR, f"stitched-{int(time.time())}.jpeg")
+    cv2.imwrite(path, stitched)
+    return jsonify({"result": "ok", "obstacles": len(mosaic), "path": path})
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="serve requests with the waitress WSGI server instead of the Flask development server",
+    )
+    parser.add_argument(
+        "--planner-only",
+        action="store_true",
+        help="serve /path only, without importing torch, ultralytics and cv2",
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="load the model and run one inference before serving requests",
+    )
+    parser.add_argument(
+        "--no-annotation",
+        action="store_true",
+        help="save the /image uploads as they are, without drawing the detections",
+    )
+    parser.add_argument("--planning-workers", type=int)
+    parser.add_argument("--planning-queue-size", type=int)
+    parser.add_argument("--inference-workers", type=int)
+    parser.add_argument("--inference-queue-size", type=int)
+    parser.add_argument(
+        "--inference-batch-window-ms", type=float, default=INFERENCE_BATCH_WINDOW_MS
+    )
+    parser.add_argument(
+        "--inference-batch-size", type=int, default=INFERENCE_BATCH_SIZE
+    )
+    args = parser.parse_args()
+
+    planning_executor.configure(args.planning_workers, args.planning_queue_size)
+    inference_executor.configure(args.inference_workers, args.inference_queue_size)
+    inference_batcher = make_inference_batcher(
+        args.inference_batch_window_ms, args.inference_batch_size
+    )
+    image_writer.annotate = ANNOTATE_IMAGES and not args.no_annotation
+    planner_only = args.planner_only
+    if args.warmup and not planner_only:
+        import model as ModelModule
+
+        start = time.time()
+        ModelModule.warm_up(get_model())
+        print(f"Time taken to load and warm up the model: {time.time() - start}s")
+    if args.production:
+        from waitress import serve
+
+        # Requests wait on the executors in waitress's threads. There is a thread for every job the executors accept,
+        # so that the executors answer 503 when they are full, and a few more for /status and /metrics
+        threads = (
+            planning_executor.workers
+            + planning_executor.queue_size
+            + inference_executor.workers
+            + inference_executor.queue_size
+            + 4
+        )
+        serve(app, host="0.0.0.0", port=5000, threads=threads)
+    else:
+        app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,158 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the histogram buckets, from 1ms to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class Histogram:
+    """Prometheus histogram, with one series per value of its label (the stage, by default)"""
+
+    def __init__(
+        self, name: str, documentation: str, buckets=DEFAULT_BUCKETS, label="stage"
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label = label
+        # stage -> [per bucket counts (+Inf last), sum, count]
+        self.series = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, value: float):
+        with self.lock:
+            if stage not in self.series:
+                self.series[stage] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts, _, _ = series = self.series[stage]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> str:
+        """Returns the histogram in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for stage, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f'{self.name}_bucket{{{self.label}="{stage}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'{self.name}_sum{{{self.label}="{stage}"}} {total}')
+                lines.append(f'{self.name}_count{{{self.label}="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Times the stages of one request, and records every stage into a histogram when it ends
+
+    Usage:
+        timer = StageTimer(PATH_STAGE_SECONDS)
+        with timer.stage("commands"):
+            ...
+        timer.timings  # {"commands": <milliseconds>}
+    """
+
+    def __init__(self, histogram: Histogram = None):
+        """
+        Args:
+            histogram (Histogram, optional): histogram receiving the stages. Defaults to None, to only keep `timings`
+        """
+        self.histogram = histogram
+        # Milliseconds taken by each stage, in the order they ran
+        self.timings = dict()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """Record a stage that was timed elsewhere"""
+        self.timings[name] = self.timings.get(name, 0) + seconds * 1000
+        if self.histogram is not None:
+            self.histogram.observe(name, seconds)
+
+
+PATH_STAGE_SECONDS = Histogram(
+    "mdp_path_stage_seconds", "Time spent in each stage of a /path request"
+)
+IMAGE_STAGE_SECONDS = Histogram(
+    "mdp_image_stage_seconds", "Time spent in each stage of an /image request"
+)
+INFERENCE_BATCH_SECONDS = Histogram(
+    "mdp_inference_batch_seconds",
+    "Time images wait for their inference batch to start (wait) and time taken by each batched forward pass (forward)",
+)
+INFERENCE_BATCH_SIZES = Histogram(
+    "mdp_inference_batch_size",
+    "Number of images in each batched forward pass",
+    buckets=BATCH_SIZE_BUCKETS,
+    label="model",
+)
+
+
+def render_cache_counters(caches: dict) -> str:
+    """Returns the hit and miss counters of caches in the Prometheus text exposition format
+
+    Args:
+        caches (dict): caches by name, each with a `stats()` method returning a dictionary of counters
+    """
+    lines = []
+    for counter in ("hits", "disk_hits", "perceptual_hits", "misses"):
+        name = f"mdp_cache_{counter}_total"
+        lines += [f"# HELP {name} Cache {counter.replace('_', ' ')}", f"# TYPE {name} counter"]
+        for cache in sorted(caches):
+            stats = caches[cache].stats()
+            if counter in stats:
+                lines.append(f'{name}{{cache="{cache}"}} {stats[counter]}')
+    return "\n".join(lines) + "\n"
+
+
+def render_executor_counters(executors: dict) -> str:
+    """Returns the number of rejected jobs of executors in the Prometheus text exposition format
+
+    Args:
+        executors (dict): BoundedExecutor by name
+    """
+    name = "mdp_executor_rejected_total"
+    lines = [
+        f"# HELP {name} Jobs turned away because the queue was full (images the image writer dropped)",
+        f"# TYPE {name} counter",
+    ]
+    for executor in sorted(executors):
+        lines.append(f'{name}{{executor="{executor}"}} {executors[executor].rejected}')
+    return "\n".join(lines) + "\n"
+
+
+def render_metrics(caches: dict = None, executors: dict = None) -> str:
+    """Returns every histogram, and the counters of the given caches and executors, in the Prometheus text exposition
+    format
+    """
+    text = "".join(
+        histogram.render()
+        for histogram in (
+            PATH_STAGE_SECONDS,
+            IMAGE_STAGE_SECONDS,
+            INFERENCE_BATCH_SECONDS,
+            INFERENCE_BATCH_SIZES,
+        )
+    )
+    if caches:
+        text += render_cache_counters(caches)
+    if executors:
+        text += render_executor_counters(executors)
+    return text
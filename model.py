@@ -1,5 +1,6 @@
 import os
 import shutil
+import threading
 import time
 import glob
 import torch
@@ -8,6 +9,7 @@ import cv2
 import numpy as np
 from ultralytics import YOLO
 import math
+from consts import ROI_COLUMNS, ROI_IMAGE_SIZE, ROI_FAR_IMAGE_SIZE, ROI_FAR_DISTANCE
 
 SPECIAL_LABELS = {
     "arrow-bullseye": "id00",
@@ -57,55 +59,170 @@ def YoloV8(weight="best_v8.pt"):
     return YOLO(weight)
 
 
-def rec_img(model: YOLO, file_data: bytes):
+def warm_up(model: YOLO, size=640):
+    """
+    Run one inference on a blank image, so that the first request does not pay for the lazy initialisation of the model
+    """
+    model(np.zeros((size, size, 3), dtype=np.uint8), verbose=False)
+
+
+# ultralytics predictors are not thread-safe. Without a MicroBatcher, the inference workers call the model directly,
+# so they take turns on it
+_predict_lock = threading.Lock()
+
+
+def predict_batch(model: YOLO, items: list) -> list:
+    """
+    Run the model on a list of (image, imgsz) items, with one forward pass per input size. An imgsz of None uses the
+    model's default size. Used as the batch function of the inference MicroBatcher. Calls from several threads run
+    one at a time
+    """
+    results = [None] * len(items)
+    indices_by_size = {}
+    for index, (_, imgsz) in enumerate(items):
+        indices_by_size.setdefault(imgsz, []).append(index)
+
+    with _predict_lock:
+        for imgsz, indices in indices_by_size.items():
+            images = [items[index][0] for index in indices]
+            if imgsz is None:
+                outputs = model(images)
+            else:
+                outputs = model(images, imgsz=imgsz)
+            for index, output in zip(indices, outputs):
+                results[index] = output
+    return results
+
+
+def crop_to_hint(image_instance, hint: str, distance: float = None):
+    """
+    Crop an image to the columns where the obstacle is expected, and pick the size to run the crop at
+
+    hint: "L", "R" or "C", the position of the obstacle in the frame given by the suffix of the SNAP command
+    distance: optional number of grid cells between the robot and the obstacle. Obstacles further than
+        ROI_FAR_DISTANCE are run at ROI_FAR_IMAGE_SIZE, so that their smaller symbol keeps enough pixels
+
+    Returns the crop (a view of the image), the x of its left edge in the image, and the inference size
+    """
+    left, right = ROI_COLUMNS[hint]
+    width = image_instance.shape[1]
+    x_offset = int(width * left)
+    crop = image_instance[:, x_offset : int(width * right)]
+
+    imgsz = ROI_IMAGE_SIZE
+    if distance is not None and distance > ROI_FAR_DISTANCE:
+        imgsz = ROI_FAR_IMAGE_SIZE
+    return crop, x_offset, imgsz
+
+
+def read_detections(result, x_offset: int = 0) -> dict:
+    """
+    Convert the boxes of one model result to the detections returned by rec_img
+
+    x_offset: x of the image the model ran on within the full frame, so that the bounds are in full frame pixels
+    """
+    response_obj = {}
+    for index, box in enumerate(result.boxes):
+        # Bounding box
+        x1, y1, x2, y2 = box.xyxy[0]
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)  # Convert to int values
+        x1, x2 = x1 + x_offset, x2 + x_offset
+
+        # Confidence
+        confidence = math.ceil((box.conf[0] * 100)) / 100
+        print("Confidence --->", confidence)
+        # Class name
+        cls = int(box.cls[0])
+        print("Class name -->", CLASSNAMES_MAP[cls])
+
+        response_obj[index] = {
+            "confidence": confidence,
+            "bounds": [x1, y1, x2, y2],
+            "area": abs(x1 - x2) * abs(y1 - y2),
+            "id": int(CLASSNAMES_MAP[cls][-2:]),
+        }
+    return response_obj
+
+
+def perceptual_hash(image_instance) -> int:
+    """
+    64 bit difference hash of an image: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right
+    neighbour. Re-encoded or near-identical frames give hashes differing in only a few bits
+    """
+    gray = cv2.cvtColor(image_instance, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def rec_img(
+    model: YOLO,
+    file_data: bytes,
+    timings: dict = None,
+    infer=None,
+    hint: str = None,
+    distance: float = None,
+    cache=None,
+):
+    """
+    Detect the symbols in an image. The image is not drawn on, see annotate_image
+
+    timings: optional dictionary that receives the seconds spent in the "cache", "decode", "roi_inference" and
+        "inference" stages. "roi_inference" is only present if a hint was given, and "inference" only if the full
+        frame was run
+    infer: optional callable running the model on one (image, imgsz) item and returning its result, such as a
+        MicroBatcher sharing forward passes between requests. Defaults to calling the model directly, one request at
+        a time
+    hint: optional "L", "R" or "C" suffix of the SNAP command. The model first runs on the part of the frame given
+        by crop_to_hint, at a reduced size, and only runs on the full frame if nothing is detected there
+    distance: optional number of grid cells between the robot and the obstacle, see crop_to_hint
+    cache: optional DetectionCache. A frame found in it, by its bytes or (if the cache is perceptual) by the
+        perceptual hash of the decoded frame, is answered without inference. Other frames are stored in it
+
+    Returns (image_id, response_obj, image_instance, cached). image_instance is None if the bytes were found in the
+    cache, as the frame is then not decoded
+    """
+    if timings is None:
+        timings = {}
+    if infer is None:
+        infer = lambda item: predict_batch(model, [item])[0]
+
+    if cache is not None:
+        start = time.perf_counter()
+        cache_key = cache.make_key(file_data)
+        cached = cache.get(cache_key)
+        timings["cache"] = time.perf_counter() - start
+        if cached is not None:
+            return (*cached, None, True)
+
+    start = time.perf_counter()
     np_data = np.frombuffer(file_data, dtype=np.uint8)
 
     # Open the file-like object as a PIL Image
     image_instance = cv2.imdecode(np_data, cv2.IMREAD_COLOR)
+    timings["decode"] = time.perf_counter() - start
 
-    result = model(image_instance)
+    frame_hash = None
+    if cache is not None and cache.perceptual:
+        start = time.perf_counter()
+        frame_hash = perceptual_hash(image_instance)
+        cached = cache.get_similar(frame_hash, cache_key)
+        timings["cache"] += time.perf_counter() - start
+        if cached is not None:
+            return (*cached, image_instance, True)
 
     response_obj = {}
-
-    for r in result:
-        for index, box in enumerate(r.boxes):
-            # Bounding box
-            x1, y1, x2, y2 = box.xyxy[0]
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)  # Convert to int values
-
-            # Draw box on the image
-            cv2.rectangle(image_instance, (x1, y1), (x2, y2), (255, 0, 255), 3)
-
-            # Confidence
-            confidence = math.ceil((box.conf[0] * 100)) / 100
-            print("Confidence --->", confidence)
-            # Class name
-            cls = int(box.cls[0])
-            print("Class name -->", CLASSNAMES_MAP[cls])
-
-            response_obj[index] = {
-                "confidence": confidence,
-                "bounds": [x1, y1, x2, y2],
-                "area": abs(x1 - x2) * abs(y1 - y2),
-                "id": int(CLASSNAMES_MAP[cls][-2:]),
-            }
-
-            # Object details
-            org = [x1, y1]
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            fontScale = 7
-            color = (0, 255, 0)
-            thickness = 12
-
-            cv2.putText(
-                image_instance,
-                CLASSNAMES_MAP[cls],
-                org,
-                font,
-                fontScale,
-                color,
-                thickness,
-            )
+    if hint is not None:
+        start = time.perf_counter()
+        crop, x_offset, imgsz = crop_to_hint(image_instance, hint, distance)
+        response_obj = read_detections(infer((crop, imgsz)), x_offset)
+        timings["roi_inference"] = time.perf_counter() - start
+
+    # Without a hint, or if the hinted region has no symbol, run the full frame
+    if not response_obj:
+        start = time.perf_counter()
+        response_obj = read_detections(infer((image_instance, None)))
+        timings["inference"] = time.perf_counter() - start
 
     # TODO: handle the case for multiple box detected (in response_obj)
 
@@ -119,7 +236,41 @@ def rec_img(model: YOLO, file_data: bytes):
     if image_id == 0:
         print("IMAGE NOT DETECTED!!!! TRY HARDER")
 
-    return (image_id, response_obj, image_instance)
+    if cache is not None:
+        cache.put(cache_key, (image_id, response_obj), frame_hash)
+
+    return (image_id, response_obj, image_instance, False)
+
+
+def annotate_image(image_instance, response_obj: dict):
+    """
+    Draw the bounding box and class name of every detection of rec_img onto the image
+    """
+    for obj in response_obj.values():
+        x1, y1, x2, y2 = obj["bounds"]
+
+        # Draw box on the image
+        cv2.rectangle(image_instance, (x1, y1), (x2, y2), (255, 0, 255), 3)
+
+        # Object details
+        org = [x1, y1]
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        fontScale = 7
+        color = (0, 255, 0)
+        thickness = 12
+
+        cv2.putText(
+            image_instance,
+            # Class names are "id" followed by the two digit id
+            f"id{obj['id']:02d}",
+            org,
+            font,
+            fontScale,
+            color,
+            thickness,
+        )
+
+    return image_instance
 
 
 ############################### LEGACY CODE ###################################
@@ -0,0 +1,113 @@
+import threading
+import numpy as np
+
+
+class Mosaic:
+    """Stitched image of the best view of each obstacle, updated as the /image results arrive
+
+    The mosaic is a fixed grid of `max_tiles` tiles of `tile_width` x `tile_height` pixels, allocated once, so memory
+    stays bounded however many images are received. Each obstacle gets the next free tile, which is only redrawn when a
+    view with a larger detection arrives. Obstacles arriving once every tile is taken are dropped.
+    """
+
+    def __init__(
+        self,
+        tile_width: int,
+        tile_height: int,
+        columns: int,
+        max_tiles: int,
+        margin: float = 2.0,
+    ):
+        """
+        Args:
+            tile_width (int): width of a tile in pixels
+            tile_height (int): height of a tile in pixels
+            columns (int): number of tiles per row
+            max_tiles (int): number of obstacles the mosaic holds
+            margin (float, optional): size of the crop around a detection, relative to the detection. Defaults to 2.0.
+        """
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.columns = columns
+        self.max_tiles = max_tiles
+        self.margin = margin
+        # Obstacles dropped because every tile was taken
+        self.dropped = 0
+        rows = -(-max_tiles // columns)
+        self._canvas = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+        # Tile index and detection area of each obstacle
+        self._tiles = {}
+        self._areas = {}
+        self._lock = threading.Lock()
+
+    def add(self, obstacle_id, image_instance, response_obj: dict):
+        """Put an image in the tile of its obstacle, if it shows a larger detection than the current tile
+
+        Args:
+            obstacle_id: id of the obstacle in view. If None, the id of the largest detected symbol is used, and images
+                without detections are skipped
+            image_instance (np.ndarray): the image, in BGR
+            response_obj (dict): detections returned by rec_img, their bounds are used to crop the image
+        """
+        best = max(response_obj.values(), key=lambda obj: obj["area"], default=None)
+        if obstacle_id is None:
+            if best is None:
+                return
+            obstacle_id = best["id"]
+        area = best["area"] if best is not None else 0
+
+        with self._lock:
+            if obstacle_id in self._tiles:
+                if area <= self._areas[obstacle_id]:
+                    return
+            elif len(self._tiles) == self.max_tiles:
+                self.dropped += 1
+                return
+            else:
+                self._tiles[obstacle_id] = len(self._tiles)
+            self._areas[obstacle_id] = area
+            index = self._tiles[obstacle_id]
+
+        tile = self.make_tile(image_instance, best["bounds"] if best is not None else None)
+        row, column = divmod(index, self.columns)
+        y, x = row * self.tile_height, column * self.tile_width
+        with self._lock:
+            # A larger view may have been drawn while this one was resized
+            if self._areas[obstacle_id] == area:
+                self._canvas[y : y + self.tile_height, x : x + self.tile_width] = tile
+
+    def make_tile(self, image_instance, bounds=None) -> np.ndarray:
+        """Crop an image around a detection, keeping the aspect ratio of the tiles, and resize it to a tile
+
+        Args:
+            image_instance (np.ndarray): the image
+            bounds (list, optional): [x1, y1, x2, y2] of the detection. Defaults to None, to use the whole image
+        """
+        import cv2
+
+        height, width = image_instance.shape[:2]
+        crop = image_instance
+        if bounds is not None:
+            x1, y1, x2, y2 = bounds
+            aspect = self.tile_width / self.tile_height
+            crop_height = max(y2 - y1, (x2 - x1) / aspect) * self.margin
+            crop_height = int(min(crop_height, height, width / aspect))
+            crop_width = int(crop_height * aspect)
+            # Center the crop on the detection, shifted back inside the image at the edges
+            left = min(max((x1 + x2 - crop_width) // 2, 0), width - crop_width)
+            top = min(max((y1 + y2 - crop_height) // 2, 0), height - crop_height)
+            if crop_width > 0 and crop_height > 0:
+                crop = image_instance[top : top + crop_height, left : left + crop_width]
+        return cv2.resize(crop, (self.tile_width, self.tile_height), interpolation=cv2.INTER_AREA)
+
+    def image(self) -> np.ndarray:
+        """Returns a copy of the mosaic, cut to the rows holding a tile (and to the used columns of a single row)"""
+        with self._lock:
+            used = len(self._tiles)
+            rows = max(-(-used // self.columns), 1)
+            columns = min(max(used, 1), self.columns)
+            return self._canvas[: rows * self.tile_height, : columns * self.tile_width].copy()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tiles)
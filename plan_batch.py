@@ -0,0 +1,138 @@
+"""
+Plan many /path requests offline
+
+Reads one /path request body per line of a JSONL file, solves them over a pool of worker processes and writes one
+result per line, in the order they finish:
+
+    {"index": <line number, from 0>, "data": {"distance", "path", "commands", "proven_optimal", "cached", "timings"}, "error": null}
+
+Usage:
+    python plan_batch.py layouts.jsonl plans.jsonl --workers 4
+    cat layouts.jsonl | python plan_batch.py - - > plans.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from algo.planner import plan_path
+from consts import Direction
+from metrics import PATH_STAGE_SECONDS, StageTimer
+
+
+def solve_line(index: int, line: str) -> dict:
+    """Solve one /path request body
+
+    Returns:
+        dict: the result line, with the error message instead of the data if the request could not be solved
+    """
+    try:
+        content = json.loads(line)
+        time_budget_ms = content.get("time_budget_ms")
+        deadline = None
+        if time_budget_ms is not None:
+            deadline = time.monotonic() + time_budget_ms / 1000
+
+        timer = StageTimer(PATH_STAGE_SECONDS)
+        data = plan_path(
+            content["obstacles"],
+            content["robot_x"],
+            content["robot_y"],
+            Direction(content["robot_dir"]),
+            content["retrying"],
+            big_turn=int(content.get("big_turn", 0)),
+            deadline=deadline,
+            timer=timer,
+        )
+        data["timings"] = timer.timings
+        return {"index": index, "data": data, "error": None}
+    except Exception as e:
+        return {"index": index, "data": None, "error": f"{type(e).__name__}: {e}"}
+
+
+def _init_worker():
+    # The planner logs to stdout, which may be the output file
+    sys.stdout = sys.stderr
+
+
+def read_lines(file):
+    """Yields (index, line) of the non blank lines of a file, reading it lazily"""
+    for index, line in enumerate(file):
+        if line.strip():
+            yield index, line
+
+
+def run(input_file, output_file, workers: int, max_pending: int):
+    """Solve every line of input_file and write the results to output_file as they finish. At most max_pending
+    requests are read ahead of the results written, so memory does not grow with the size of the input.
+
+    Returns:
+        Tuple[int, int]: number of results written and number of failures
+    """
+    written = failed = 0
+
+    def write(result: dict):
+        nonlocal written, failed
+        output_file.write(json.dumps(result) + "\n")
+        output_file.flush()
+        written += 1
+        failed += result["error"] is not None
+
+    lines = read_lines(input_file)
+    if workers == 1:
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        try:
+            for index, line in lines:
+                write(solve_line(index, line))
+        finally:
+            sys.stdout = stdout
+        return written, failed
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = set()
+        for index, line in lines:
+            pending.add(pool.submit(solve_line, index, line))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+        for future in wait(pending).done:
+            write(future.result())
+
+    return written, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan /path request bodies read from a JSONL file")
+    parser.add_argument("input", help="JSONL file of /path request bodies, - for stdin")
+    parser.add_argument("output", help="JSONL file of results, - for stdout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="requests read ahead of the results written (default: 2 per worker)",
+    )
+    args = parser.parse_args()
+    max_pending = args.max_pending or 2 * args.workers
+
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w")
+    start = time.time()
+    try:
+        written, failed = run(input_file, output_file, args.workers, max_pending)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    print(
+        f"Planned {written} layouts ({failed} failed) in {time.time() - start:.2f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
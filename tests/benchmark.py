@@ -0,0 +1,248 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+from algo.algo import MazeSolver, SEARCH_MODES, ORDER_MODES
+from algo.cache import edge_cache
+from algo.helper import command_generator
+from consts import Direction, WIDTH, HEIGHT
+
+# Start state of the robot, same as the default of the simulator
+ROBOT_X, ROBOT_Y, ROBOT_DIRECTION = 1, 1, Direction.NORTH
+STAGES = (
+    "get_view_obstacle_positions",
+    "path_cost_generator",
+    "get_optimal_order_dp",
+    "command_generator",
+)
+PERCENTILES = (50, 90, 95, 99)
+
+
+def generate_layout(rng: random.Random, n: int, max_attempts=1000) -> list:
+    """Draw a random layout of n obstacles in the /path request format
+
+    An obstacle is placed on a free cell of the arena, away from the robot's start area, and only kept if the robot
+    still has a reachable view state for every obstacle once it is added.
+
+    Args:
+        rng (random.Random): seeded generator, so that a seed always gives the same layout
+        n (int): number of obstacles
+
+    Returns:
+        list: obstacles as dictionaries with keys "x", "y", "d" and "id"
+    """
+    for _ in range(max_attempts):
+        obstacles = []
+        maze_solver = MazeSolver(WIDTH, HEIGHT, ROBOT_X, ROBOT_Y, ROBOT_DIRECTION)
+        used = set()
+        while len(obstacles) < n:
+            x, y = rng.randrange(WIDTH), rng.randrange(HEIGHT)
+            # Keep clear of the 3x3 robot footprint and one cell around it
+            if (x, y) in used or (x <= ROBOT_X + 2 and y <= ROBOT_Y + 2):
+                continue
+            used.add((x, y))
+            obstacle = {
+                "x": x,
+                "y": y,
+                "d": int(rng.choice(list(Direction))),
+                "id": len(obstacles) + 1,
+            }
+            obstacles.append(obstacle)
+            maze_solver.add_obstacle(x, y, obstacle["d"], obstacle["id"])
+
+        view_positions = maze_solver.grid.get_view_obstacle_positions(retrying=False)
+        if all(view_positions):
+            return obstacles
+
+    raise RuntimeError(f"Could not place {n} obstacles in {max_attempts} attempts")
+
+
+def build_solver(obstacles: list, args) -> MazeSolver:
+    maze_solver = MazeSolver(
+        WIDTH,
+        HEIGHT,
+        ROBOT_X,
+        ROBOT_Y,
+        ROBOT_DIRECTION,
+        big_turn=args.big_turn,
+        search_mode=args.search_mode,
+        cache_edges=args.cache_edges,
+        order_mode=args.order_mode,
+    )
+    for ob in obstacles:
+        maze_solver.add_obstacle(ob["x"], ob["y"], ob["d"], ob["id"])
+    return maze_solver
+
+
+def time_layout(obstacles: list, args) -> dict:
+    """Time every stage of the planner once on a layout
+
+    Returns:
+        dict: seconds taken by each stage
+    """
+    timings = dict()
+    if not args.cache_edges:
+        edge_cache.clear()
+
+    maze_solver = build_solver(obstacles, args)
+    start = time.perf_counter()
+    view_positions = maze_solver.grid.get_view_obstacle_positions(args.retrying)
+    timings["get_view_obstacle_positions"] = time.perf_counter() - start
+
+    items = [maze_solver.robot.get_start_state()]
+    for view_position in view_positions:
+        items = items + view_position
+    start = time.perf_counter()
+    maze_solver.path_cost_generator(items)
+    timings["path_cost_generator"] = time.perf_counter() - start
+
+    # A new solver, so that the end to end time does not reuse the cost table filled above
+    if not args.cache_edges:
+        edge_cache.clear()
+    maze_solver = build_solver(obstacles, args)
+    start = time.perf_counter()
+    optimal_path, _ = maze_solver.get_optimal_order_dp(retrying=args.retrying)
+    timings["get_optimal_order_dp"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    command_generator(optimal_path, obstacles)
+    timings["command_generator"] = time.perf_counter() - start
+
+    return timings
+
+
+def summarize(samples: list) -> dict:
+    """Latency percentiles of a list of durations, in milliseconds"""
+    samples_ms = np.array(samples) * 1000
+    summary = {
+        f"p{q}": float(value)
+        for q, value in zip(PERCENTILES, np.percentile(samples_ms, PERCENTILES))
+    }
+    summary.update(
+        {
+            "min": float(samples_ms.min()),
+            "max": float(samples_ms.max()),
+            "mean": float(samples_ms.mean()),
+            "count": int(samples_ms.size),
+        }
+    )
+    return summary
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Find the stages whose median latency grew by more than threshold compared to a previous run
+
+    Returns:
+        list: (obstacle count, stage, baseline p50, current p50) of every regression
+    """
+    regressions = []
+    for n, stages in results["results"].items():
+        for stage, summary in stages.items():
+            previous = baseline["results"].get(n, dict()).get(stage)
+            if previous is None:
+                continue
+            if summary["p50"] > previous["p50"] * (1 + threshold):
+                regressions.append((n, stage, previous["p50"], summary["p50"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the path planner on seeded random layouts"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--layouts", type=int, default=10, help="layouts per obstacle count")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per layout")
+    parser.add_argument("--min-obstacles", type=int, default=1)
+    parser.add_argument("--max-obstacles", type=int, default=10)
+    parser.add_argument("--big-turn", type=int, default=0)
+    parser.add_argument("--retrying", action="store_true")
+    parser.add_argument("--search-mode", choices=SEARCH_MODES, default="astar")
+    parser.add_argument("--order-mode", choices=ORDER_MODES, default="gtsp")
+    parser.add_argument(
+        "--cache-edges",
+        action="store_true",
+        help="keep the process-wide edge cache between runs instead of timing cold searches",
+    )
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="results of a previous run to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative growth of the median latency reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "seed": args.seed,
+            "layouts": args.layouts,
+            "repeat": args.repeat,
+            "big_turn": args.big_turn,
+            "retrying": args.retrying,
+            "search_mode": args.search_mode,
+            "order_mode": args.order_mode,
+            "cache_edges": args.cache_edges,
+            "unit": "ms",
+        },
+        "results": dict(),
+    }
+
+    # Untimed run on a layout of its own, so that the first sample does not pay for building the heuristic table of
+    # this turn setting and the other one-off setup of the planner
+    time_layout(generate_layout(random.Random(f"{args.seed}-warm-up"), args.max_obstacles), args)
+
+    for n in range(args.min_obstacles, args.max_obstacles + 1):
+        # One generator per obstacle count, so that changing the range does not change the layouts
+        rng = random.Random(f"{args.seed}-{n}")
+        samples = {stage: [] for stage in STAGES}
+        for _ in range(args.layouts):
+            obstacles = generate_layout(rng, n)
+            for _ in range(args.repeat):
+                for stage, duration in time_layout(obstacles, args).items():
+                    samples[stage].append(duration)
+
+        results["results"][str(n)] = {
+            stage: summarize(durations) for stage, durations in samples.items()
+        }
+        print(
+            f"{n} obstacles: "
+            + ", ".join(
+                f"{stage} p50 {summary['p50']:.2f}ms"
+                for stage, summary in results["results"][str(n)].items()
+            )
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for n, stage, previous, current in regressions:
+            print(f"REGRESSION {n} obstacles {stage}: p50 {previous:.2f}ms -> {current:.2f}ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
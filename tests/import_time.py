@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules the server must not import until an image endpoint is called
+HEAVY_MODULES = ("torch", "ultralytics", "cv2", "model")
+
+# Run in a fresh interpreter: time the import of the server and list which heavy modules it loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(runs: int) -> dict:
+    """Import the server in `runs` fresh interpreters
+
+    Returns:
+        dict: median and max import time in milliseconds, and the heavy modules that were imported
+    """
+    samples = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE % (HEAVY_MODULES,)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["ms"])
+        loaded.update(result["loaded"])
+    return {
+        "median_ms": statistics.median(samples),
+        "max_ms": max(samples),
+        "heavy_modules": sorted(loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that the server imports quickly and without the model"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=1000,
+        help="maximum median time to import main.py",
+    )
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(json.dumps(result))
+    if result["heavy_modules"]:
+        print(f"FAIL: importing main.py loads {', '.join(result['heavy_modules'])}")
+        sys.exit(1)
+    if result["median_ms"] > args.budget_ms:
+        print(f"FAIL: median import time {result['median_ms']:.0f}ms > {args.budget_ms:.0f}ms")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()